@@ -0,0 +1,138 @@
+"""
+Benchmark of the giveaway scheduler with many concurrent giveaways: one sleeping task per giveaway
+(previous implementation) versus the single heap-based scheduler task of the cog, fed from the
+`giveaways` table of a temporary database.
+
+Reports the memory held while the giveaways are pending, the timer drift (how late each giveaway
+is ended compared to its deadline) and the time of a catch-up pass over deadlines missed while offline.
+The winners are not drawn, only the end time is recorded.
+
+Usage: python benchmarks/giveaway_scheduler.py [giveaways] [spread seconds]
+"""
+
+import asyncio
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import aiosqlite  # noqa: E402
+
+from cogs.giveaway import Giveaway  # noqa: E402
+from database import DatabaseManager  # noqa: E402
+
+SCHEMA = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "database", "schema.sql")
+
+
+def report(label: str, memory: int, drifts: list) -> None:
+    drifts.sort()
+    print(
+        f"{label:<18} | {memory / 2**20:7.2f} MiB | drift p50 {drifts[len(drifts) // 2] * 1e3:6.2f} ms"
+        f" | p99 {drifts[int(len(drifts) * 0.99)] * 1e3:6.2f} ms | max {drifts[-1] * 1e3:6.2f} ms"
+    )
+
+
+async def ready() -> None:
+    pass
+
+
+async def make_cog(deadlines: dict, drifts: list) -> Giveaway:
+    connection = await aiosqlite.connect(os.path.join(tempfile.mkdtemp(), "bench.db"))
+    with open(SCHEMA) as file:
+        await connection.executescript(file.read())
+    await connection.executemany(
+        "INSERT INTO giveaways(message_id, channel_id, server_id, prize, winners, end_time) VALUES (?, 0, 0, '', 1, ?)",
+        deadlines.items(),
+    )
+    await connection.commit()
+    bot = types.SimpleNamespace(
+        database=DatabaseManager(connection=connection), add_view=lambda view: None, wait_until_ready=ready
+    )
+    cog = Giveaway(bot)
+
+    async def end_giveaways(message_ids):
+        now = time.time()
+        drifts.extend(now - deadlines[message_id] for message_id in message_ids)
+
+    cog.end_giveaways = end_giveaways
+    return cog
+
+
+async def close(cog: Giveaway) -> None:
+    await cog.cog_unload()
+    await cog.bot.database.connection.close()
+
+
+async def one_task_per_giveaway(deadlines: dict) -> None:
+    drifts = []
+
+    async def end_after_delay(message_id, delay):
+        await asyncio.sleep(delay)
+        drifts.append(time.time() - deadlines[message_id])
+
+    gc.collect()
+    tracemalloc.start()
+    tasks = [
+        asyncio.create_task(end_after_delay(message_id, end - time.time())) for message_id, end in deadlines.items()
+    ]
+    await asyncio.sleep(0)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    await asyncio.gather(*tasks)
+    report("one task each", memory, drifts)
+
+
+async def heap_scheduler(deadlines: dict) -> None:
+    drifts = []
+    cog = await make_cog(deadlines, drifts)
+    gc.collect()
+    tracemalloc.start()
+    await cog.cog_load()
+    # The first pass of the scheduler loads the upcoming deadlines from the database
+    while len(cog.scheduled) < len(deadlines):
+        await asyncio.sleep(0)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    while len(drifts) < len(deadlines):
+        await asyncio.sleep(0.05)
+    await close(cog)
+    report("heap scheduler", memory, drifts)
+
+
+async def catch_up(count: int) -> None:
+    """Every deadline passed while the bot was offline: they must all end in the first pass"""
+    now = time.time()
+    deadlines = {message_id: now - random.uniform(1, 86400) for message_id in range(count)}
+    drifts = []
+    cog = await make_cog(deadlines, drifts)
+    start = time.perf_counter()
+    await cog.cog_load()
+    while len(drifts) < count:
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+    await close(cog)
+    print(f"{'catch-up':<18} | {count:,} missed deadlines ended in {elapsed * 1e3:.1f} ms")
+
+
+async def main(count: int, spread: float) -> None:
+    rng = random.Random(count)
+    start = time.time() + 1
+    deadlines = {message_id: start + rng.uniform(0, spread) for message_id in range(count)}
+    await one_task_per_giveaway(deadlines)
+    start = time.time() + 1
+    deadlines = {message_id: start + rng.uniform(0, spread) for message_id in range(count)}
+    await heap_scheduler(deadlines)
+    await catch_up(count)
+
+
+if __name__ == "__main__":
+    # The cog imports a legacy giveaways.json from the working directory
+    os.chdir(tempfile.mkdtemp())
+    arguments = sys.argv[1:]
+    asyncio.run(main(int(arguments[0]) if arguments else 10_000, float(arguments[1]) if len(arguments) > 1 else 10.0))
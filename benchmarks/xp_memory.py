@@ -0,0 +1,71 @@
+"""
+Memory benchmark of the in-memory XP layouts: the former dict-of-dicts loaded from xp_data.json
+versus the GuildXP columns (with and without their rank index).
+
+Usage: python benchmarks/xp_memory.py [sizes...]
+"""
+
+import gc
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from cogs.xp import GuildXP, RankIndex  # noqa: E402
+
+
+def make_rows(size: int):
+    rng = random.Random(size)
+    # Snowflake-sized IDs and heavy-tailed counters, like a real guild
+    for _ in range(size):
+        yield rng.getrandbits(60), int(rng.paretovariate(1.2))
+
+
+def dict_layout(rows) -> dict:
+    return {
+        "797781758841847808": {
+            str(user_id): {"messages": messages, "level": messages // 400 + 1}
+            for user_id, messages in rows
+        }
+    }
+
+
+def columns_without_index(rows) -> GuildXP:
+    guild = GuildXP.from_rows(rows)
+    guild.rank_index = RankIndex()
+    return guild
+
+
+def measure(factory, size: int) -> int:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    # The rows are generated inside the measurement, so the IDs kept by a layout are counted
+    data = factory(make_rows(size))
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del data
+    return size
+
+
+def bench(size: int) -> None:
+    layouts = {
+        "dict of dicts": dict_layout,
+        "columns": columns_without_index,
+        "columns + rank index": GuildXP.from_rows,
+    }
+    results = {name: measure(factory, size) for name, factory in layouts.items()}
+    line = " | ".join(
+        f"{name} {total / 2**20:8.1f} MiB ({total / size:6.1f} B/user)"
+        for name, total in results.items()
+    )
+    print(f"{size:>9,} users | {line}")
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    for size in sizes:
+        bench(size)
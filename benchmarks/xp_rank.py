@@ -0,0 +1,72 @@
+"""
+Micro-benchmark of /rank: full sort of the guild (previous implementation) versus the RankIndex.
+
+Usage: python benchmarks/xp_rank.py [sizes...]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from cogs.xp import RankIndex  # noqa: E402
+
+QUERIES = 200
+
+
+def make_guild(size: int) -> dict:
+    rng = random.Random(size)
+    # Heavy-tailed activity: lots of tiny counters, a few very large ones
+    return {
+        str(user_id): {"messages": int(rng.paretovariate(1.2)), "level": 1}
+        for user_id in range(size)
+    }
+
+
+def sort_rank(guild: dict, user_id: str) -> int:
+    sorted_users = sorted(
+        guild.items(), key=lambda x: (x[1]["level"], x[1]["messages"]), reverse=True
+    )
+    return next((index + 1 for index, (uid, _) in enumerate(sorted_users) if uid == user_id), 0)
+
+
+def timed(func, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def bench(size: int) -> None:
+    guild = make_guild(size)
+    rng = random.Random(0)
+    users = rng.sample(list(guild), QUERIES)
+
+    build = timed(RankIndex.from_counts, ((uid, d["messages"]) for uid, d in guild.items()))
+    index = RankIndex.from_counts((uid, d["messages"]) for uid, d in guild.items())
+
+    sort_queries = users[: max(1, QUERIES // max(1, size // 10_000))]
+    sort_time = timed(lambda: [sort_rank(guild, uid) for uid in sort_queries]) / len(sort_queries)
+    rank_time = timed(lambda: [index.rank_of(guild[uid]["messages"]) for uid in users]) / len(users)
+    top_time = timed(lambda: [index.top(10) for _ in users]) / len(users)
+
+    def increments():
+        for uid in users:
+            old = guild[uid]["messages"]
+            guild[uid]["messages"] = old + 1
+            index.move(uid, old, old + 1)
+
+    move_time = timed(increments) / len(users)
+
+    print(
+        f"{size:>9,} users | build {build * 1e3:8.1f} ms | sort rank {sort_time * 1e3:9.2f} ms"
+        f" | index rank {rank_time * 1e6:6.1f} us | top 10 {top_time * 1e6:6.1f} us"
+        f" | increment {move_time * 1e6:6.1f} us"
+    )
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    for size in sizes:
+        bench(size)
@@ -0,0 +1,89 @@
+"""
+Startup benchmark of the XP cog on a synthetic 200-guild database: loading every guild at startup
+(previous behaviour) versus loading only the guilds that are actually active.
+
+Usage: python benchmarks/xp_startup.py [active guilds...]
+"""
+
+import asyncio
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import aiosqlite  # noqa: E402
+
+from cogs.xp import XP, GuildXP  # noqa: E402
+from database import DatabaseManager  # noqa: E402
+
+GUILDS = 200
+LARGEST_GUILD = 50_000
+SCHEMA = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "database", "schema.sql")
+
+
+async def make_database(path: str) -> None:
+    rng = random.Random(0)
+    async with aiosqlite.connect(path) as db:
+        with open(SCHEMA) as file:
+            await db.executescript(file.read())
+        for guild in range(GUILDS):
+            # Guild sizes follow a Zipf law: a few big guilds and a long tail of small ones
+            size = max(1, LARGEST_GUILD // (guild + 1))
+            await db.executemany(
+                "INSERT INTO xp(user_id, server_id, xp, level) VALUES (?, ?, ?, 1)",
+                [(rng.getrandbits(60), guild, int(rng.paretovariate(1.2))) for _ in range(size)],
+            )
+        await db.commit()
+
+
+async def eager(database: DatabaseManager) -> dict:
+    """Former cog_load: read the whole table and build every guild"""
+    rows = {}
+    async with await database.connection.execute("SELECT user_id, server_id, xp FROM xp") as cursor:
+        for user_id, server_id, messages in await cursor.fetchall():
+            rows.setdefault(server_id, []).append((user_id, messages))
+    return {server_id: GuildXP.from_rows(users) for server_id, users in rows.items()}
+
+
+async def lazy(database: DatabaseManager, active: int) -> dict:
+    """Current cog_load, then the first access of `active` guilds picked at random"""
+    bot = types.SimpleNamespace(config={}, database=database)
+    cog = XP(bot)
+    await cog.load_settings()
+    for server_id in random.Random(active).sample(range(GUILDS), active):
+        await cog.load_guild(server_id)
+    return cog.xp_data
+
+
+async def measure(label: str, coro) -> None:
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    data = await coro
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    resident = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    users = sum(len(guild) for guild in data.values())
+    print(f"{label:<22} | {elapsed * 1e3:8.1f} ms | {resident / 2**20:7.1f} MiB | {len(data):3} guilds, {users:,} users")
+
+
+async def main(active_counts: list) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        await make_database(path)
+        async with aiosqlite.connect(path) as connection:
+            database = DatabaseManager(connection=connection)
+            await measure("eager (all guilds)", eager(database))
+            for active in active_counts:
+                await measure(f"lazy ({active} active)", lazy(database, active))
+
+
+if __name__ == "__main__":
+    asyncio.run(main([int(arg) for arg in sys.argv[1:]] or [5, 20, 50]))
@@ -0,0 +1,170 @@
+"""
+End-to-end benchmark of the XP cog: add_message, /rank and /leaderboard driven with fake messages and
+interactions (no network) on a real SQLite database, for guilds of several sizes with Zipf-distributed activity.
+
+Reports messages/sec (flushes included), p50/p99 latency of each handler, bytes written to storage per
+message and the peak RSS of the process. Sizes run in increasing order, so the peak RSS of a line is the
+one of the largest guild so far.
+
+Usage: python benchmarks/xp_throughput.py [--sizes 1000 10000 100000] [--messages 50000] [--zipf 1.1]
+                                          [--directory DIR]
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import aiosqlite  # noqa: E402
+import discord  # noqa: E402
+from discord import app_commands  # noqa: E402
+
+from cogs.xp import XP, LEADERBOARD_PAGE_SIZE  # noqa: E402
+from database import DatabaseManager  # noqa: E402
+
+SCHEMA = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "database", "schema.sql")
+GUILD_ID = 1
+COMMANDS = 2000
+
+
+class FakeResponse:
+    async def send_message(self, *args, **kwargs) -> None:
+        pass
+
+
+class FakeMember:
+    def __init__(self, user_id: int) -> None:
+        self.id = user_id
+        self.display_name = f"member-{user_id}"
+        self.color = discord.Color.default()
+        self.display_avatar = types.SimpleNamespace(url=f"https://cdn.example/{user_id}.png")
+
+
+class FakeGuild:
+    def __init__(self, size: int) -> None:
+        self.id = GUILD_ID
+        self.name = "benchmark"
+        self.members = {user_id: FakeMember(user_id) for user_id in range(size)}
+
+    def get_member(self, user_id: int):
+        return self.members.get(user_id)
+
+
+def interaction(guild: FakeGuild, user: FakeMember):
+    return types.SimpleNamespace(guild_id=guild.id, guild=guild, user=user, response=FakeResponse())
+
+
+def written_bytes(paths: list) -> int:
+    """Bytes written by the process (SQLite runs in an aiosqlite thread), or the storage size as a fallback"""
+    try:
+        with open("/proc/self/io") as file:
+            return next(int(line.split()[1]) for line in file if line.startswith("wchar:"))
+    except OSError:
+        return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+
+
+def percentiles(samples: list) -> str:
+    samples.sort()
+    p50 = samples[len(samples) // 2]
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return f"p50 {p50 * 1e6:7.1f} us | p99 {p99 * 1e6:7.1f} us"
+
+
+def zipf_users(size: int, count: int, exponent: float, rng: random.Random) -> list:
+    weights = list(itertools.accumulate(1 / (rank + 1) ** exponent for rank in range(size)))
+    users = list(range(size))
+    rng.shuffle(users)
+    return rng.choices(users, cum_weights=weights, k=count)
+
+
+async def bench(size: int, messages: int, exponent: float, directory: str) -> None:
+    path = os.path.join(directory, f"bench-{size}.db")
+    rng = random.Random(size)
+    async with aiosqlite.connect(path) as connection:
+        with open(SCHEMA) as file:
+            await connection.executescript(file.read())
+        await connection.execute("PRAGMA synchronous=NORMAL")
+        # The guild already has a history: every member starts with a Zipf-shaped counter
+        history = zipf_users(size, size * 20, exponent, rng)
+        counts = {}
+        for user_id in history:
+            counts[user_id] = counts.get(user_id, 0) + 1
+        await connection.executemany(
+            "INSERT INTO xp(user_id, server_id, xp, level) VALUES (?, ?, ?, 1)",
+            [(user_id, GUILD_ID, count) for user_id, count in counts.items()],
+        )
+        await connection.commit()
+
+        guild = FakeGuild(size)
+        bot = types.SimpleNamespace(
+            config={}, database=DatabaseManager(connection=connection),
+            get_channel=lambda channel_id: None, get_user=lambda user_id: None, get_guild=lambda server_id: guild,
+        )
+        cog = XP(bot)
+        await cog.load_settings()
+        await cog.load_guild(GUILD_ID)
+
+        # add_message, with the write-behind flush triggered the same way flush_task would
+        senders = zipf_users(size, messages, exponent, rng)
+        storage = [path, path + "-wal"]
+        written = written_bytes(storage)
+        latencies = []
+        start = time.perf_counter()
+        timestamp = time.time()
+        for index, user_id in enumerate(senders):
+            before = time.perf_counter()
+            await cog.add_message(user_id, GUILD_ID, timestamp + index * 0.01)
+            latencies.append(time.perf_counter() - before)
+            if len(cog.dirty) >= cog.flush_max_dirty:
+                await cog.flush_xp_data()
+        await cog.flush_xp_data()
+        elapsed = time.perf_counter() - start
+        written = written_bytes(storage) - written
+        print(
+            f"{size:>7,} users | add_message {messages / elapsed:9,.0f} msg/s | {percentiles(latencies)}"
+            f" | {written / messages:6.1f} B written/msg"
+        )
+
+        members = [guild.members[user_id] for user_id in rng.sample(range(size), min(size, COMMANDS))]
+        latencies = []
+        for member in members:
+            before = time.perf_counter()
+            await cog.rank.callback(cog, interaction(guild, member), None)
+            latencies.append(time.perf_counter() - before)
+        print(f"{size:>7,} users | rank        {'':13} | {percentiles(latencies)}")
+
+        pages = max(1, size // LEADERBOARD_PAGE_SIZE)
+        for period in ("all", "daily"):
+            choice = app_commands.Choice(name=period, value=period)
+            latencies = []
+            for member in members:
+                before = time.perf_counter()
+                await cog.leaderboard.callback(cog, interaction(guild, member), rng.randint(1, pages), choice)
+                latencies.append(time.perf_counter() - before)
+            print(f"{size:>7,} users | leaderboard {period:<13} | {percentiles(latencies)}")
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"{size:>7,} users | peak RSS {peak:8.1f} MiB")
+
+
+async def main(arguments) -> None:
+    with tempfile.TemporaryDirectory(dir=arguments.directory) as directory:
+        for size in sorted(arguments.sizes):
+            await bench(size, arguments.messages, arguments.zipf, directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--messages", type=int, default=50_000)
+    parser.add_argument("--zipf", type=float, default=1.1, help="exponent of the activity distribution")
+    parser.add_argument("--directory", help="where to create the database, to compare storage devices")
+    asyncio.run(main(parser.parse_args()))
@@ -195,13 +195,25 @@ class DiscordBot(commands.Bot):
         )
         self.logger.info("-------------------")
         await self.init_db()
+        # The database must be available before the cogs are loaded, some of them read from it in cog_load
+        connection = await aiosqlite.connect(
+            f"{os.path.realpath(os.path.dirname(__file__))}/database/database.db"
+        )
+        # With the WAL journal (enabled in schema.sql) commits are appends to the log, NORMAL is enough to stay consistent after a crash
+        await connection.execute("PRAGMA synchronous=NORMAL")
+        self.database = DatabaseManager(connection=connection)
         await self.load_cogs()
         self.status_task.start()
-        self.database = DatabaseManager(
-            connection=await aiosqlite.connect(
-                f"{os.path.realpath(os.path.dirname(__file__))}/database/database.db"
-            )
-        )
+
+    async def close(self) -> None:
+        """
+        Unloads the cogs (so they can save their pending data) before closing the database connection.
+        """
+        await super().close()
+        if self.database is not None:
+            # Fold the write-ahead log back into the database file so the next start has nothing to replay
+            await self.database.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            await self.database.connection.close()
 
     async def on_message(self, message: discord.Message) -> None:
         """
@@ -1,86 +1,319 @@
 import asyncio
+import heapq
 import json
+import math
 import os
-import datetime
 import random
+import secrets
+import time
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord.ext.commands import Context
 
+LEGACY_GIVEAWAYS_FILE = "giveaways.json"  # ancien stockage, importé une fois dans la table `giveaways`
+SCHEDULE_HORIZON = 3600.0  # secondes d'échéances chargées en mémoire à la fois
+SCHEDULER_RETRY_DELAY = 30.0  # secondes d'attente après une erreur du planificateur
+CHANNEL_RETRY_DELAY = 600.0  # secondes avant de retenter un giveaway dont le salon est injoignable
+SNAPSHOT_BATCH_SIZE = 1000  # participants par réactions écrits par transaction lors de la capture
+GIVEAWAY_EMOJI = "🎉"
+REROLL_MAX_WINNERS = 20  # gagnants tirés au plus par un reroll
+MESSAGE_MAX_LENGTH = 2000  # limite de Discord pour le texte d'un message
+
+
+def _open_uniform(rng):
+    """Nombre aléatoire dans ]0, 1[, utilisable dans un logarithme"""
+    value = rng.random()
+    while value == 0.0:
+        value = rng.random()
+    return value
+
+
+async def reservoir_sample(entrants, k, rng):
+    """
+    Tire uniformément `k` éléments d'un itérateur asynchrone de longueur inconnue (algorithme L de Li).
+
+    Seuls les `k` éléments retenus sont gardés en mémoire, et le générateur n'est sollicité qu'à chaque
+    remplacement. Avec le même `rng` (même graine) et les mêmes éléments dans le même ordre, le tirage est identique.
+    """
+    reservoir = []
+    if k <= 0:
+        return reservoir
+    index = 0
+    next_index = None
+    weight = 1.0
+    async for item in entrants:
+        if len(reservoir) < k:
+            reservoir.append(item)
+            if len(reservoir) == k:
+                weight = math.exp(math.log(_open_uniform(rng)) / k)
+                next_index = k + math.floor(math.log(_open_uniform(rng)) / math.log(1 - weight))
+        elif index == next_index:
+            reservoir[rng.randrange(k)] = item
+            weight *= math.exp(math.log(_open_uniform(rng)) / k)
+            next_index += 1 + math.floor(math.log(_open_uniform(rng)) / math.log(1 - weight))
+        index += 1
+    return reservoir
+
+class GiveawayView(discord.ui.View):
+    """Bouton de participation persistant : une seule instance, enregistrée au chargement du cog, sert tous les giveaways"""
+
+    def __init__(self, cog):
+        super().__init__(timeout=None)
+        self.cog = cog
+
+    @discord.ui.button(label="Participate", emoji="🎉", style=discord.ButtonStyle.green, custom_id="giveaway:enter")
+    async def enter(self, interaction: discord.Interaction, button: discord.ui.Button):
+        database = self.cog.bot.database
+        message_id = interaction.message.id
+        if await database.get_giveaway(message_id) is None:
+            await interaction.response.send_message("This giveaway is over.", ephemeral=True)
+            return
+        # La clé primaire (message, utilisateur) ignore les doubles participations
+        if await database.add_giveaway_entry(message_id, interaction.user.id):
+            await interaction.response.send_message("You're in, good luck! 🍀", ephemeral=True)
+        else:
+            await interaction.response.send_message("You are already participating in this giveaway.", ephemeral=True)
+
+
 class Giveaway(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.giveaways = self.load_giveaways()
-        self.schedule_giveaways()  # Planifier les giveaways au démarrage
+        self.entry_view = GiveawayView(self)
+        # Les giveaways en cours vivent dans la table `giveaways` : seuls ceux qui se terminent avant
+        # `horizon` sont gardés en mémoire, dans un tas de (fin, message) avec l'échéance en vigueur par message.
+        # Une entrée du tas dont l'échéance ne correspond plus est ignorée en arrivant en tête
+        self.deadlines = []
+        self.scheduled = {}
+        self.horizon = 0.0
+        self.schedule_changed = asyncio.Event()
 
-    def load_giveaways(self):
-        if os.path.exists("giveaways.json"):
-            try:
-                with open("giveaways.json", "r") as f:
-                    data = json.load(f)
-                print("Giveaways chargés avec succès.")
-                return data
-            except json.JSONDecodeError:
-                print("Error: giveaways.json is not a valid JSON. Empty giveaways initialization.")
-                return []
-            except Exception as e:
-                print(f"Unexpected error when loading giveaways : {e}")
-                return []
-        else:
-            print("giveaways.json not found. Initialization of empty giveaways.")
-            return []
+    async def cog_load(self):
+        await self.import_legacy_giveaways()
+        # Les boutons des giveaways déjà publiés restent actifs après un redémarrage
+        self.bot.add_view(self.entry_view)
+        # Le premier passage charge les giveaways à venir, et termine ceux échus pendant l'arrêt du bot
+        self.scheduler_task.start()
 
-    def save_giveaways(self):
+    async def cog_unload(self):
+        self.scheduler_task.cancel()
+        self.entry_view.stop()
+
+    async def import_legacy_giveaways(self, path=LEGACY_GIVEAWAYS_FILE):
+        """Importe une seule fois l'ancien fichier giveaways.json dans la base puis le renomme"""
+        if not os.path.exists(path):
+            return
         try:
-            with open("giveaways.json", "w") as f:
-                json.dump(self.giveaways, f, indent=4)
-            print("Giveaways successfully saved.")
+            with open(path, "r") as f:
+                legacy = json.load(f)
         except Exception as e:
-            print(f"Error saving giveaways: {e}")
-
-    def schedule_giveaways(self):
-        current_time = datetime.datetime.utcnow().timestamp()
-        for giveaway in self.giveaways:
-            end_time = giveaway["end_time"]
-            remaining_time = end_time - current_time
-            if remaining_time > 0:
-                # Planifier la fin du giveaway après le temps restant
-                asyncio.create_task(self.end_giveaway_after_delay(giveaway["message_id"], remaining_time))
-            else:
-                # Si le temps est écoulé, terminer le giveaway immédiatement
-                asyncio.create_task(self.end_giveaway(giveaway["message_id"]))
-
-    async def end_giveaway_after_delay(self, message_id: int, delay: float):
-        await asyncio.sleep(delay)
-        await self.end_giveaway(message_id)
-
-    async def end_giveaway(self, message_id: int) -> None:
-        giveaway = next((g for g in self.giveaways if g["message_id"] == message_id), None)
-        if not giveaway:
+            # Le fichier est laissé en place pour pouvoir le corriger et relancer l'import
+            print(f"Error importing {path}: {e}")
             return
 
-        # Retirer le giveaway de la liste et sauvegarder
-        self.giveaways = [g for g in self.giveaways if g["message_id"] != message_id]
-        self.save_giveaways()
+        for giveaway in legacy:
+            await self.bot.database.add_giveaway(
+                giveaway["message_id"], giveaway["channel_id"], None,
+                giveaway["prize"], giveaway["winners"], giveaway["end_time"], "reaction"
+            )
+        os.replace(path, path + ".imported")
+        print(f"{len(legacy)} giveaways imported from {path}.")
 
-        channel = self.bot.get_channel(giveaway["channel_id"])
-        if channel is None:
+    def schedule(self, message_id: int, end_time: float) -> None:
+        """Planifie (ou replanifie) la fin d'un giveaway en O(log n) si elle tombe dans l'horizon chargé"""
+        if end_time > self.horizon:
+            # Elle sera chargée depuis la base par un prochain rechargement
             return
+        self.scheduled[message_id] = end_time
+        heapq.heappush(self.deadlines, (end_time, message_id))
+        if self.deadlines[0] == (end_time, message_id):
+            # Nouvelle échéance la plus proche : le planificateur doit raccourcir son attente
+            self.schedule_changed.set()
 
+    def unschedule(self, message_id: int) -> None:
+        """Annule la fin planifiée d'un giveaway ; son entrée sera retirée du tas en arrivant en tête"""
+        self.scheduled.pop(message_id, None)
+        if len(self.deadlines) > 2 * len(self.scheduled) + 64:
+            # Trop d'entrées obsolètes : on reconstruit le tas en O(n)
+            self.deadlines = [(end_time, message_id) for message_id, end_time in self.scheduled.items()]
+            heapq.heapify(self.deadlines)
+
+    @tasks.loop()
+    async def scheduler_task(self):
         try:
-            message = await channel.fetch_message(giveaway["message_id"])
+            await self.run_scheduler()
+        except Exception as e:
+            # Une erreur ne doit pas arrêter la boucle : le prochain passage recharge les échéances depuis la base
+            print(f"Error in the giveaway scheduler: {e}")
+            self.horizon = 0.0
+            await asyncio.sleep(SCHEDULER_RETRY_DELAY)
+
+    @scheduler_task.before_loop
+    async def before_scheduler_task(self):
+        # Les salons doivent être dans le cache avant de terminer les giveaways échus pendant l'arrêt
+        await self.bot.wait_until_ready()
+
+    async def run_scheduler(self) -> None:
+        now = time.time()
+        if now >= self.horizon:
+            # Charge par l'index sur end_time les giveaways qui se terminent d'ici le prochain rechargement
+            horizon = now + SCHEDULE_HORIZON
+            for message_id, end_time in await self.bot.database.get_giveaways_ending_before(horizon):
+                if self.scheduled.get(message_id) != end_time:
+                    self.scheduled[message_id] = end_time
+                    heapq.heappush(self.deadlines, (end_time, message_id))
+            self.horizon = horizon
+
+        # Retire les entrées annulées ou replanifiées arrivées en tête du tas
+        while self.deadlines and self.scheduled.get(self.deadlines[0][1]) != self.deadlines[0][0]:
+            heapq.heappop(self.deadlines)
+
+        # Dort jusqu'à la prochaine échéance (ou le prochain rechargement), ou jusqu'à ce qu'une échéance plus proche soit planifiée
+        wake_up = min(self.deadlines[0][0], self.horizon) if self.deadlines else self.horizon
+        delay = wake_up - time.time()
+        if delay > 0:
+            try:
+                await asyncio.wait_for(self.schedule_changed.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            self.schedule_changed.clear()
+            return
+
+        # Toutes les échéances passées sont traitées d'un coup, y compris celles manquées pendant un arrêt
+        now = time.time()
+        due = []
+        while self.deadlines and self.deadlines[0][0] <= now:
+            end_time, message_id = heapq.heappop(self.deadlines)
+            if self.scheduled.get(message_id) == end_time:
+                del self.scheduled[message_id]
+                due.append(message_id)
+        await self.end_giveaways(due)
+
+    async def resolve_channel(self, channel_id: int):
+        """Salon depuis le cache, sinon depuis l'API ; lève discord.NotFound s'il a été supprimé"""
+        return self.bot.get_channel(channel_id) or await self.bot.fetch_channel(channel_id)
+
+    async def end_giveaways(self, message_ids: list) -> None:
+        """Termine un lot de giveaways échus : retirés de la base en une transaction, puis tirés au sort un par un"""
+        channels = {}
+        for message_id in message_ids:
+            giveaway = await self.bot.database.get_giveaway(message_id)
+            if giveaway is None:
+                continue
+            try:
+                channels[message_id] = await self.resolve_channel(giveaway[1])
+            except discord.NotFound:
+                # Salon supprimé : le giveaway est clos sans annonce, ses participants restent pour un reroll
+                channels[message_id] = None
+            except discord.HTTPException as e:
+                # Salon injoignable pour l'instant : le giveaway reste en base et sera retenté
+                print(f"Giveaway {message_id} postponed, channel {giveaway[1]} unavailable: {e}")
+                self.schedule(message_id, time.time() + CHANNEL_RETRY_DELAY)
+        if not channels:
+            return
+        for message_id, _, _, prize, winners, _, entry_mode in await self.bot.database.take_giveaways(list(channels)):
+            if channels[message_id] is None:
+                print(f"Giveaway {message_id} ended without announcement, its channel was deleted.")
+                continue
+            try:
+                await self.draw_winners(channels[message_id], message_id, prize, winners, entry_mode)
+            except Exception as e:
+                print(f"Error ending giveaway {message_id}: {e}")
+
+    def belongs_to(self, giveaway, guild) -> bool:
+        """Vérifie qu'un giveaway a été lancé sur ce serveur ; ceux importés de giveaways.json sont rattachés par leur salon"""
+        server_id = giveaway[2]
+        if server_id is None:
+            channel = self.bot.get_channel(giveaway[1])
+            server_id = channel.guild.id if getattr(channel, "guild", None) else None
+        return guild is not None and server_id == guild.id
+
+    @staticmethod
+    def is_eligible(guild, user_id: int) -> bool:
+        # Un participant doit encore être membre du serveur (vérifié dans le cache, sans appel à l'API)
+        return guild is None or not guild.chunked or guild.get_member(user_id) is not None
+
+    async def reaction_entrants(self, channel, message_id: int):
+        """Participants d'un giveaway à réactions, lus page par page et filtrés au fil de l'eau"""
+        try:
+            message = await channel.fetch_message(message_id)
         except discord.NotFound:
             return
+        # La réaction du giveaway, quelle que soit sa position parmi les autres réactions du message
+        reaction = discord.utils.find(lambda r: str(r.emoji) == GIVEAWAY_EMOJI, message.reactions)
+        if reaction is None:
+            return
+        async for user in reaction.users():
+            if not user.bot and self.is_eligible(channel.guild, user.id):
+                yield user.id
+
+    async def snapshot_reactions(self, channel, message_id: int) -> None:
+        """Copie par lots les participants par réactions dans `giveaway_entries`, pour que les rerolls n'aient plus à les relire"""
+        batch = []
+        async for user_id in self.reaction_entrants(channel, message_id):
+            batch.append(user_id)
+            if len(batch) >= SNAPSHOT_BATCH_SIZE:
+                await self.bot.database.add_giveaway_entries(message_id, batch)
+                batch = []
+        await self.bot.database.add_giveaway_entries(message_id, batch)
+
+    async def draw(self, message_id: int, count: int, guild=None, exclude=frozenset()) -> tuple:
+        """
+        Tire `count` gagnants parmi les participants enregistrés encore membres de `guild`, hors `exclude`,
+        en mémoire O(count), et renvoie (gagnants, graine).
 
-        users = [user async for user in message.reactions[0].users() if not user.bot]
+        La graine vient de `secrets` et est publiée avec le résultat : rejouer `reservoir_sample` sur les mêmes
+        participants (par identifiant croissant, sans les exclus ni les partis) avec `random.Random(graine)` redonne le tirage.
+        Les gagnants ne sont enregistrés qu'à leur annonce, par `announce_winners`.
+        """
+        seed = secrets.token_hex(16)
+        entrants = (
+            user_id async for user_id in self.bot.database.iter_giveaway_entries(message_id)
+            if user_id not in exclude and self.is_eligible(guild, user_id)
+        )
+        winners = await reservoir_sample(entrants, count, random.Random(seed))
+        return winners, seed
+
+    async def announce_winners(
+        self, destination, message_id: int, winners: list, seed: str, before: str, after: str
+    ) -> None:
+        """
+        Annonce les gagnants dans `destination` (mentions entre `before` et `after`), en plusieurs messages
+        si elles dépassent la limite de Discord.
+
+        Chaque groupe de gagnants n'est enregistré qu'une fois son message envoyé : un gagnant jamais annoncé
+        n'est pas exclu des rerolls suivants.
+        """
+        after += f"\n-# Draw seed: `{seed}`"
+        budget = MESSAGE_MAX_LENGTH - len(before) - len(after)
+        groups = [[]]
+        for user_id in winners:
+            mentions = ", ".join(f"<@{winner}>" for winner in groups[-1] + [user_id])
+            if groups[-1] and len(mentions) > budget:
+                groups.append([])
+            groups[-1].append(user_id)
+        for group in groups:
+            await destination.send(before + ", ".join(f"<@{user_id}>" for user_id in group) + after)
+            await self.bot.database.add_giveaway_winners(message_id, group, seed)
+
+    async def draw_winners(
+        self, channel, message_id: int, prize: str, winner_count: int, entry_mode: str = "button"
+    ) -> None:
+        # Les participants sont figés à la fin du giveaway : tirage et rerolls se font ensuite depuis la base
+        if entry_mode == "reaction":
+            await self.snapshot_reactions(channel, message_id)
+        else:
+            # Le bouton est retiré sans relire le message
+            try:
+                await channel.get_partial_message(message_id).edit(view=None)
+            except discord.HTTPException:
+                pass
+        winners, seed = await self.draw(message_id, winner_count, getattr(channel, "guild", None))
 
-        if len(users) == 0:
+        if len(winners) == 0:
             await channel.send("No one participated in the giveaway.")
             return
 
-        winners = random.sample(users, min(giveaway["winners"], len(users)))
-        winner_mentions = ", ".join([winner.mention for winner in winners])
-        await channel.send(f"Congratulations {winner_mentions} ! You've won **{giveaway['prize']}** !")
+        await self.announce_winners(channel, message_id, winners, seed, "Congratulations ", f" ! You've won **{prize}** !")
 
     def parse_duration(self, duration: str) -> int:
         unit = duration[-1]
@@ -115,50 +348,82 @@ class Giveaway(commands.Cog):
             await ctx.send(str(e))
             return
 
-        end_time = (datetime.datetime.utcnow() + datetime.timedelta(seconds=duration_seconds)).timestamp()
+        end_time = time.time() + duration_seconds
         end_timestamp = int(end_time)
         embed = discord.Embed(
             title="🎉 Giveaway ! 🎉",
-            description=f"Prize : {prize}\nReact with 🎉 to participate !\nEnds on : <t:{end_timestamp}:f>\nNumber of winners : {winners}",
+            description=f"Prize : {prize}\nClick 🎉 Participate to enter !\nEnds on : <t:{end_timestamp}:f>\nNumber of winners : {winners}",
             color=0xBEBEFE,
         )
-        message = await ctx.send(embed=embed)
-        await message.add_reaction("🎉")
-
-        self.giveaways.append({
-            "message_id": message.id,
-            "channel_id": ctx.channel.id,
-            "prize": prize,
-            "winners": winners,
-            "end_time": end_time
-        })
-        self.save_giveaways()
+        message = await ctx.send(embed=embed, view=self.entry_view)
+
+        await self.bot.database.add_giveaway(
+            message.id, ctx.channel.id, ctx.guild.id if ctx.guild else None, prize, winners, end_time
+        )
 
         # Planifier la fin du giveaway sans bloquer
-        asyncio.create_task(self.end_giveaway_after_delay(message.id, duration_seconds))
+        self.schedule(message.id, end_time)
+
+    @commands.command(name="cancel_giveaway", description="Cancel a running giveaway without drawing it")
+    @commands.has_permissions(manage_messages=True)
+    async def cancel_giveaway(self, ctx: Context, message_id: int) -> None:
+        """
+        Annuler un giveaway en cours, sans tirage.
+        :param ctx: Le contexte de la commande.
+        :param message_id: L'ID du message du giveaway.
+        """
+        giveaway = await self.bot.database.get_giveaway(message_id)
+        if giveaway is None or not self.belongs_to(giveaway, ctx.guild):
+            await ctx.send("Giveaway not found.")
+            return
+
+        self.unschedule(message_id)
+        await self.bot.database.delete_giveaway(message_id)
+        channel = self.bot.get_channel(giveaway[1])
+        if channel is not None:
+            # Le bouton de participation est retiré du message
+            try:
+                await channel.get_partial_message(message_id).edit(view=None)
+            except discord.HTTPException:
+                pass
+        await ctx.send(f"The giveaway for **{giveaway[3]}** has been cancelled.")
 
     @commands.command(name="reroll", description="Relaunching a giveaway")
-    async def reroll_giveaway(self, ctx: Context, message_id: int) -> None:
+    @commands.has_permissions(manage_messages=True)
+    async def reroll_giveaway(
+        self, ctx: Context, message_id: int, count: commands.Range[int, 1, REROLL_MAX_WINNERS] = 1,
+        exclude_winners: bool = True
+    ) -> None:
         """
         Relancer un giveaway.
         :param ctx: Le contexte de la commande.
         :param message_id: L'ID du message du giveaway.
+        :param count: Le nombre de nouveaux gagnants (REROLL_MAX_WINNERS au plus).
+        :param exclude_winners: Exclure les gagnants précédents (oui par défaut).
         """
-        channel = ctx.channel
-        try:
-            message = await channel.fetch_message(message_id)
-        except discord.NotFound:
-            await ctx.send("Message not found.")
+        # Tout vient de la capture faite à la fin du giveaway : aucun appel à l'API, quel que soit le salon du serveur
+        giveaway = await self.bot.database.get_ended_giveaway(message_id)
+        if giveaway is None:
+            running = await self.bot.database.get_giveaway(message_id)
+            in_guild = running is not None and self.belongs_to(running, ctx.guild)
+            await ctx.send("This giveaway is still running." if in_guild else "Giveaway not found.")
             return
+        if not self.belongs_to(giveaway, ctx.guild):
+            # Un giveaway d'un autre serveur ne peut pas être relancé, même par son ID
+            await ctx.send("Giveaway not found.")
+            return
+        prize = giveaway[3]
 
-        users = [user async for user in message.reactions[0].users() if not user.bot]
+        exclude = set(await self.bot.database.get_giveaway_winners(message_id)) if exclude_winners else set()
+        winners, seed = await self.draw(message_id, count, ctx.guild, exclude)
 
-        if len(users) == 0:
-            await ctx.send("No one participated in the giveaway.")
+        if len(winners) == 0:
+            await ctx.send("No one left to draw in this giveaway." if exclude else "No one participated in the giveaway.")
             return
 
-        winner = random.choice(users)
-        await channel.send(f"Congratulations {winner.mention} ! You have won the giveaway reroll !")
+        await self.announce_winners(
+            ctx, message_id, winners, seed, "Congratulations ", f" ! You have won the reroll of **{prize}** !"
+        )
 
 async def setup(bot):
     await bot.add_cog(Giveaway(bot))
\ No newline at end of file
@@ -1,103 +1,1361 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
+import asyncio
+import bisect
+from array import array
+from collections import Counter, OrderedDict
+import hashlib
+import io
+import itertools
 import json
 import os
 import math
+import sys
+import time
+
+# Pillow est optionnel : sans lui, /rank reste en mode embed
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    Image = None
+
+# Valeurs par défaut de l'écriture différée, surchargeables via la section "xp" de config.json
+DEFAULT_FLUSH_INTERVAL = 30.0  # secondes entre deux sauvegardes au maximum
+DEFAULT_FLUSH_MAX_DIRTY = 500  # nombre d'entrées modifiées qui force une sauvegarde anticipée
+LEGACY_XP_FILE = "xp_data.json"  # ancien stockage, importé une fois dans la table `xp`
+IMPORT_BATCH_SIZE = 1000
+# Compteur maximal accepté à l'import : l'index de classement a une case par nombre de messages
+IMPORT_MAX_MESSAGES = 2_000_000
+EXPORT_FORMATS = ("csv", "ndjson")
+MESSAGE_QUEUE_SIZE = 10000  # messages en attente de comptage au-delà desquels les nouveaux sont abandonnés
+MESSAGE_BATCH_SIZE = 500  # messages comptés d'affilée avant de rendre la main à la boucle
+LEADERBOARD_PAGE_SIZE = 10
+DEFAULT_LEADERBOARD_CACHE_TTL = 15.0  # secondes pendant lesquelles une page rendue est resservie telle quelle
+LEADERBOARD_CACHE_MAX = 256  # au-delà, les pages expirées sont purgées
+DEFAULT_CURVE = {"curve": "linear", "base": 400}  # 1 niveau tous les 400 messages
+DEFAULT_COOLDOWN = 0.0  # secondes entre deux messages comptés d'un même utilisateur (0 = tous comptés)
+COOLDOWN_MAX_ENTRIES = 100000  # taille maximale de la table des derniers messages comptés
+LEVEL_UP_BATCH_WINDOW = 5.0  # secondes pendant lesquelles les level up d'un salon sont regroupés
+LEVEL_UP_LINES_PER_EMBED = 30
+MESSAGE_MAX_EMBEDS = 10  # limites de Discord pour un message : nombre d'embeds
+MESSAGE_MAX_EMBED_CHARS = 6000  # et caractères cumulés de tous ses embeds
+USER_CACHE_SIZE = 512  # utilisateurs récupérés par l'API gardés en cache (hors cache des membres)
+DEFAULT_EVICTION_IDLE = 3600.0  # secondes sans activité avant qu'un serveur soit retiré de la mémoire
+BACKFILL_WORKERS = 3  # salons parcourus en parallèle pendant une reconstruction
+BACKFILL_CHECKPOINT_EVERY = 1000  # messages d'un salon entre deux points de reprise
+BACKFILL_PAGE_DELAY = 1.0  # pause entre deux pages d'historique (100 messages), en plus de la gestion des 429
+RANK_CARD_CACHE_SIZE = 256  # cartes de rang rendues gardées en mémoire (PNG de quelques dizaines de Ko)
+RANK_CARD_PROGRESS_STEPS = 20  # la barre de progression d'une carte avance par paliers de 5 %
+PRUNE_INTERVAL = 86400.0  # secondes minimales entre deux passes de nettoyage d'un serveur, redémarrages compris
+ROLE_UPDATE_DELAY = 1.0  # secondes entre deux appels d'attribution de rôle, tous serveurs confondus
+ACTIVITY_PERIODS = {"daily": 86400, "weekly": 7 * 86400, "monthly": 30 * 86400}
+ACTIVITY_HOURS_KEPT = 48  # au-delà, les buckets horaires sont fusionnés dans leur bucket journalier
+ACTIVITY_DAYS_KEPT = 31
+PRECOMPUTED_LEVELS = 100
+MAX_LEVEL = 10000
+MAX_CURVE_FACTOR = 10.0  # facteur maximal d'une courbe exponentielle, proposé par /setlevelcurve
+
+def render_rank_card(avatar, name, level, progress):
+    """Dessine une carte de rang en PNG ; appelée dans un thread car le rendu est bloquant"""
+    card = Image.new("RGBA", (640, 180), (43, 45, 49, 255))
+    draw = ImageDraw.Draw(card)
+    if avatar:
+        picture = Image.open(io.BytesIO(avatar)).convert("RGBA").resize((132, 132))
+        mask = Image.new("L", picture.size, 0)
+        ImageDraw.Draw(mask).ellipse((0, 0, *picture.size), fill=255)
+        card.paste(picture, (24, 24), mask)
+    draw.text((180, 30), name, fill=(255, 255, 255), font=ImageFont.load_default(size=32))
+    draw.text((180, 76), f"Level {level}", fill=(190, 190, 254), font=ImageFont.load_default(size=24))
+    draw.rounded_rectangle((180, 120, 610, 144), radius=12, fill=(30, 31, 34))
+    if progress > 0:
+        draw.rounded_rectangle((180, 120, 180 + max(24, int(430 * progress)), 144), radius=12, fill=(190, 190, 254))
+    output = io.BytesIO()
+    card.save(output, format="PNG")
+    return output.getvalue()
+
+
+def parse_xp_export(lines, errors):
+    """
+    Lit un export CSV ou NDJSON ligne par ligne et produit les paires (utilisateur, messages) valides.
+
+    Les lignes commençant par `{` sont lues en JSON, les autres en CSV (la première étant l'en-tête).
+    Les lignes invalides sont notées dans `errors` puis ignorées.
+    """
+    header = None
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            if line.startswith("{"):
+                data = json.loads(line)
+                user_id, messages = int(data["user_id"]), int(data["messages"])
+            elif header is None:
+                header = [column.strip() for column in line.split(",")]
+                if "user_id" not in header or "messages" not in header:
+                    raise ValueError("the CSV header needs user_id and messages columns")
+                continue
+            else:
+                values = dict(zip(header, line.split(",")))
+                user_id, messages = int(values["user_id"]), int(values["messages"])
+            # Les entiers SQLite sont signés sur 64 bits
+            if not 0 < user_id < 1 << 63 or not 0 <= messages <= IMPORT_MAX_MESSAGES:
+                raise ValueError("value out of range")
+        except (ValueError, KeyError, TypeError) as e:
+            errors.append(f"line {number}: {e}")
+            continue
+        yield user_id, messages
+
+
+class RankIndex:
+    """
+    Index d'ordre statistique des compteurs de messages d'un serveur.
+
+    Un arbre de Fenwick compte les utilisateurs par nombre de messages, ce qui donne le rang
+    d'un compteur et l'utilisateur à un rang donné en O(log M) (M = plus grand compteur).
+    Les ex aequo partagent le même rang ; dans l'affichage ils sont triés par ordre d'arrivée.
+    Un histogramme logarithmique (un bucket par puissance de deux) est tenu à jour à côté pour les paliers d'activité.
+    """
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.tree = [0] * (size + 1)
+        self.buckets = {}  # compteur -> utilisateurs ayant ce compteur (dict utilisé comme ensemble ordonné)
+        self.total = 0
+        self.histogram = [0] * 33  # bucket b = utilisateurs ayant entre 2^(b-1) et 2^b - 1 messages
+
+    @classmethod
+    def from_counts(cls, counts):
+        """Construit l'index en O(n + M) à partir de paires (utilisateur, compteur)"""
+        index = cls()
+        for user_id, count in counts:
+            if count > 0:
+                index.buckets.setdefault(count, {})[user_id] = None
+                index.total += 1
+                index.histogram[count.bit_length()] += 1
+        if index.buckets:
+            index.size = max(index.size, 1 << max(index.buckets).bit_length())
+        index.rebuild()
+        return index
+
+    def rebuild(self):
+        tree = [0] * (self.size + 1)
+        for count, users in self.buckets.items():
+            tree[count] += len(users)
+        for i in range(1, self.size + 1):
+            parent = i + (i & -i)
+            if parent <= self.size:
+                tree[parent] += tree[i]
+        self.tree = tree
+
+    def _update(self, count, delta):
+        i = count
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, count):
+        """Nombre d'utilisateurs ayant au plus `count` messages"""
+        count = min(count, self.size)
+        result = 0
+        while count > 0:
+            result += self.tree[count]
+            count -= count & -count
+        return result
+
+    def _select(self, position):
+        """Compteur de l'utilisateur à la position `position` (1 = le plus petit) et sa position dans le groupe"""
+        pos = 0
+        remaining = position
+        step = 1 << self.size.bit_length()
+        while step:
+            nxt = pos + step
+            if nxt <= self.size and self.tree[nxt] < remaining:
+                pos = nxt
+                remaining -= self.tree[nxt]
+            step >>= 1
+        return pos + 1, remaining
+
+    def add(self, user_id, count):
+        if count <= 0:
+            return
+        if count > self.size:
+            # Agrandit l'arbre par doublement (coût amorti), avant d'insérer le nouvel utilisateur
+            while count > self.size:
+                self.size *= 2
+            self.rebuild()
+        self.buckets.setdefault(count, {})[user_id] = None
+        self.total += 1
+        self.histogram[count.bit_length()] += 1
+        self._update(count, 1)
+
+    def remove(self, user_id, count):
+        users = self.buckets.get(count)
+        if not users or user_id not in users:
+            return
+        del users[user_id]
+        if not users:
+            del self.buckets[count]
+        self.total -= 1
+        self.histogram[count.bit_length()] -= 1
+        self._update(count, -1)
+
+    def move(self, user_id, old_count, new_count):
+        self.remove(user_id, old_count)
+        self.add(user_id, new_count)
+
+    def rank_of(self, count):
+        """Rang (1 = meilleur) d'un utilisateur ayant `count` messages"""
+        return self.total - self._prefix(count) + 1
+
+    def quantile(self, q):
+        """Compteur exact au quantile `q` (entre 0 et 1) en O(log M)"""
+        if not self.total:
+            return 0
+        return self._select(max(1, math.ceil(q * self.total)))[0]
+
+    def percentile_of(self, count):
+        """Part des utilisateurs ayant au plus `count` messages"""
+        return self._prefix(count) / self.total if self.total else 0.0
+
+    def entries(self, start, limit):
+        """
+        Renvoie jusqu'à `limit` tuples (rang, utilisateur, compteur) à partir de la position `start` (1 = meilleur).
+
+        Chaque groupe d'ex aequo traversé coûte une recherche en O(log M).
+        """
+        result = []
+        position = max(start, 1)
+        while len(result) < limit and position <= self.total:
+            count, offset = self._select(self.total - position + 1)
+            users = self.buckets[count]
+            rank = self.rank_of(count)
+            skip = len(users) - offset
+            for user_id in itertools.islice(users, skip, skip + limit - len(result)):
+                result.append((rank, user_id, count))
+            position += len(users) - skip
+        return result
+
+    def top(self, limit):
+        return self.entries(1, limit)
+
+    def around(self, count, radius=2):
+        """Utilisateurs classés autour du rang correspondant à `count`"""
+        rank = self.rank_of(count)
+        return self.entries(rank - radius, 2 * radius + 1)
+
+
+class CooldownGate:
+    """
+    Filtre anti-spam : un seul message compté par (serveur, utilisateur) et par fenêtre de cooldown.
+
+    Les derniers instants comptés sont gardés dans un OrderedDict trié du plus ancien au plus
+    récent, ce qui permet de purger en tête les entrées expirées. La taille est bornée : au-delà
+    de `max_entries`, les plus anciennes entrées sont oubliées.
+    """
+
+    def __init__(self, max_entries=COOLDOWN_MAX_ENTRIES):
+        self.last_counted = OrderedDict()
+        self.max_entries = max_entries
+        self.horizon = 0.0  # plus long cooldown configuré, au-delà une entrée ne bloque plus rien
+        self.accepted = 0
+        self.dropped = 0
+        self.dropped_by_guild = Counter()
+
+    def allow(self, server_id, user_id, cooldown, now):
+        if cooldown <= 0:
+            self.accepted += 1
+            return True
+        key = (server_id, user_id)
+        last = self.last_counted.get(key)
+        if last is not None and now - last < cooldown:
+            self.dropped += 1
+            self.dropped_by_guild[server_id] += 1
+            return False
+        self.last_counted[key] = now
+        self.last_counted.move_to_end(key)
+        # L'entrée en tête est la plus ancienne
+        last_counted = self.last_counted
+        while last_counted and (
+            len(last_counted) > self.max_entries
+            or now - next(iter(last_counted.values())) >= self.horizon
+        ):
+            last_counted.popitem(last=False)
+        self.accepted += 1
+        return True
+
+
+class ActivityWindow:
+    """
+    Compteurs d'activité glissants d'un serveur.
+
+    Chaque message incrémente le bucket de son heure ; les heures de plus de
+    ACTIVITY_HOURS_KEPT heures sont fusionnées dans le bucket de leur jour, et les jours de plus
+    de ACTIVITY_DAYS_KEPT jours sont supprimés. Une requête sur une période ne parcourt donc
+    qu'au plus 48 + 31 buckets. Au-delà des heures gardées, les bordures de période sont arrondies au jour près.
+    """
+
+    __slots__ = ("hours", "days")
+
+    def __init__(self):
+        self.hours = {}  # heure (timestamp // 3600) -> Counter(utilisateur -> messages)
+        self.days = {}  # jour (timestamp // 86400) -> Counter(utilisateur -> messages)
+
+    def add(self, user_id, timestamp, amount=1):
+        hour = int(timestamp // 3600)
+        bucket = self.hours.get(hour)
+        if bucket is None:
+            bucket = self.hours[hour] = Counter()
+        bucket[user_id] += amount
+
+    def add_day(self, user_id, day, amount):
+        self.days.setdefault(day, Counter())[user_id] += amount
+
+    def load(self, days, hours):
+        """
+        Recharge l'activité sauvegardée à partir de lignes (utilisateur, jour, messages) et (utilisateur, heure, messages).
+
+        En base, un jour compte aussi ses heures récentes : elles sont retirées de leur jour pour retrouver
+        les buckets tels qu'ils étaient en mémoire, sans quoi un jour entier serait compté dans la fenêtre quotidienne.
+        """
+        for user_id, day, messages in days:
+            self.add_day(user_id, day, messages)
+        for user_id, hour, messages in hours:
+            self.add(user_id, hour * 3600, messages)
+            bucket = self.days.get(hour // 24)
+            if bucket is not None:
+                bucket[user_id] -= messages
+                if bucket[user_id] <= 0:
+                    del bucket[user_id]
+        for day in [day for day, bucket in self.days.items() if not bucket]:
+            del self.days[day]
+
+    def remove(self, user_id):
+        for bucket in itertools.chain(self.hours.values(), self.days.values()):
+            bucket.pop(user_id, None)
+
+    def compact(self, now):
+        """Fusionne les vieilles heures dans leur jour et supprime les jours expirés"""
+        current_hour = int(now // 3600)
+        for hour in [hour for hour in self.hours if hour <= current_hour - ACTIVITY_HOURS_KEPT]:
+            self.days.setdefault(hour // 24, Counter()).update(self.hours.pop(hour))
+        oldest_day = int(now // 86400) - ACTIVITY_DAYS_KEPT
+        for day in [day for day in self.days if day < oldest_day]:
+            del self.days[day]
+
+    def totals(self, seconds, now):
+        """Messages par utilisateur sur les `seconds` dernières secondes"""
+        start = now - seconds
+        totals = Counter()
+        for hour, bucket in self.hours.items():
+            if (hour + 1) * 3600 > start:
+                totals.update(bucket)
+        for day, bucket in self.days.items():
+            if (day + 1) * 86400 > start:
+                totals.update(bucket)
+        return totals
+
+    def __bool__(self):
+        return bool(self.hours or self.days)
+
+
+class GuildXP:
+    """
+    Compteurs de messages d'un serveur stockés en colonnes compactes.
+
+    Les identifiants et les compteurs vivent dans deux `array` parallèles (8 + 4 octets par
+    utilisateur) et un dict identifiant -> position sert d'index. L'index de classement du
+    serveur est tenu à jour par les mêmes méthodes.
+    """
+
+    __slots__ = ("user_ids", "messages", "positions", "rank_index", "activity")
+
+    def __init__(self):
+        self.user_ids = array("Q")
+        self.messages = array("I")
+        self.positions = {}
+        self.rank_index = RankIndex()
+        self.activity = ActivityWindow()
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Construit le serveur à partir de paires (utilisateur, compteur)"""
+        guild = cls()
+        for user_id, messages in rows:
+            guild.positions[user_id] = len(guild.user_ids)
+            guild.user_ids.append(user_id)
+            guild.messages.append(messages)
+        # Les clés du dict sont réutilisées par l'index, les identifiants ne sont pas dupliqués
+        guild.rank_index = RankIndex.from_counts(zip(guild.positions, guild.messages))
+        return guild
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def __contains__(self, user_id):
+        return user_id in self.positions
+
+    def get(self, user_id):
+        position = self.positions.get(user_id)
+        return self.messages[position] if position is not None else 0
+
+    def set(self, user_id, messages):
+        """Fixe le compteur d'un utilisateur et renvoie l'ancien"""
+        position = self.positions.get(user_id)
+        if position is None:
+            position = self.positions[user_id] = len(self.user_ids)
+            self.user_ids.append(user_id)
+            self.messages.append(0)
+        old = self.messages[position]
+        self.messages[position] = messages
+        self.rank_index.move(user_id, old, messages)
+        return old
+
+    def increment(self, user_id, amount=1):
+        """Ajoute `amount` messages et renvoie le nouveau compteur"""
+        position = self.positions.get(user_id)
+        if position is None:
+            self.set(user_id, amount)
+            return amount
+        old = self.messages[position]
+        self.messages[position] = old + amount
+        self.rank_index.move(user_id, old, old + amount)
+        return old + amount
+
+    def remove(self, user_id):
+        """Supprime un utilisateur en O(1) (la dernière ligne prend sa place) et renvoie son compteur"""
+        position = self.positions.pop(user_id, None)
+        if position is None:
+            return 0
+        messages = self.messages[position]
+        last = len(self.user_ids) - 1
+        if position != last:
+            moved = self.user_ids[last]
+            self.user_ids[position] = moved
+            self.messages[position] = self.messages[last]
+            self.positions[moved] = position
+        self.user_ids.pop()
+        self.messages.pop()
+        self.rank_index.remove(user_id, messages)
+        self.activity.remove(user_id)
+        return messages
+
+    def items(self):
+        return zip(self.user_ids, self.messages)
+
+    def nbytes(self):
+        """Taille approximative en mémoire des compteurs et de l'index de classement (hors activité)"""
+        index = self.rank_index
+        return (
+            sys.getsizeof(self.user_ids) + sys.getsizeof(self.messages) + sys.getsizeof(self.positions)
+            + sum(map(sys.getsizeof, self.positions)) + sys.getsizeof(index.tree) + sys.getsizeof(index.buckets)
+            + sum(map(sys.getsizeof, index.buckets.values()))
+        )
+
+    def compacted(self):
+        """Copie reconstruite au plus juste : les dicts et l'arbre ne rétrécissent pas d'eux-mêmes après des suppressions"""
+        guild = GuildXP.from_rows(self.items())
+        guild.activity = self.activity
+        return guild
+
+
+class LevelCurve:
+    """
+    Courbe de progression : tableau précalculé des seuils cumulés de messages par niveau.
+
+    thresholds[i] est le nombre de messages nécessaire pour atteindre le niveau i + 1, le niveau
+    se lit donc par bisect et les messages restants par une simple soustraction. Le tableau est
+    prolongé à la demande pour les très gros compteurs.
+    """
+
+    CURVES = ("linear", "quadratic", "exponential", "custom")
+
+    def __init__(self, spec):
+        curve = spec.get("curve", "linear")
+        if curve not in self.CURVES:
+            raise ValueError(f"Unknown curve '{curve}'.")
+        self.spec = spec
+        self.base = int(spec.get("base", 400))
+        self.factor = float(spec.get("factor", 1.2))
+        if self.base < 1:
+            raise ValueError("The base must be at least 1 message.")
+        if curve == "exponential" and self.factor <= 1:
+            raise ValueError("The factor of an exponential curve must be greater than 1.")
+
+        self.thresholds = [0]
+        if curve == "custom":
+            custom = [int(value) for value in spec.get("thresholds", [])]
+            if not custom or any(b <= a for a, b in zip([0] + custom, custom)):
+                raise ValueError("Custom thresholds must be strictly increasing positive message counts.")
+            self.thresholds.extend(custom)
+        try:
+            while len(self.thresholds) < PRECOMPUTED_LEVELS:
+                self.thresholds.append(self.thresholds[-1] + self.step(len(self.thresholds)))
+        except OverflowError:
+            # Un facteur trop grand dépasse la capacité d'un float avant le dernier niveau précalculé
+            raise ValueError("The factor is too large, the thresholds overflow.") from None
+
+    def step(self, level):
+        """Nombre de messages pour passer du niveau `level` au suivant"""
+        curve = self.spec.get("curve", "linear")
+        if curve == "quadratic":
+            return self.base * level
+        if curve == "exponential":
+            return max(1, round(self.base * self.factor ** (level - 1)))
+        if curve == "custom":
+            # Au-delà du tableau fourni, on répète le dernier écart
+            return self.thresholds[-1] - self.thresholds[-2]
+        return self.base
+
+    def extend(self, messages):
+        thresholds = self.thresholds
+        while thresholds[-1] <= messages and len(thresholds) < MAX_LEVEL:
+            thresholds.append(thresholds[-1] + self.step(len(thresholds)))
+
+    def level(self, messages):
+        if messages >= self.thresholds[-1]:
+            self.extend(messages)
+        return bisect.bisect_right(self.thresholds, messages)
+
+    def bounds(self, level):
+        """Seuils (début, fin) du niveau `level`, la fin valant None au niveau maximal"""
+        end = self.thresholds[level] if level < len(self.thresholds) else None
+        return self.thresholds[level - 1], end
+
+    def messages_for_next_level(self, messages):
+        _, end = self.bounds(self.level(messages))
+        return end - messages if end is not None else 0
+
+    def progress(self, messages):
+        start, end = self.bounds(self.level(messages))
+        return (messages - start) / (end - start) if end is not None else 1.0
+
+    def thresholds_up_to(self, messages):
+        """Seuils nécessaires pour niveler des compteurs allant jusqu'à `messages`"""
+        self.extend(messages)
+        return self.thresholds[:bisect.bisect_right(self.thresholds, messages) + 1]
+
+
+class LeaderboardView(discord.ui.View):
+    def __init__(self, cog, user, guild, page, page_count, period="all"):
+        super().__init__(timeout=120)
+        self.cog = cog
+        self.user = user
+        self.guild = guild
+        self.period = period
+        self.page = page
+        self.page_count = page_count
+        self.update_buttons()
+
+    def update_buttons(self):
+        self.previous_page.disabled = self.page <= 1
+        self.next_page.disabled = self.page >= self.page_count
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.user.id:
+            await interaction.response.send_message("Use /leaderboard to browse the ranking yourself.", ephemeral=True)
+            return False
+        return True
+
+    async def show_page(self, interaction: discord.Interaction, page):
+        await self.cog.load_guild(self.guild.id)
+        self.page = max(1, min(page, self.page_count))
+        embed, self.page_count = self.cog.build_leaderboard_embed(self.guild, self.page, self.period)
+        self.update_buttons()
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.blurple)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show_page(interaction, self.page - 1)
+
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.blurple)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show_page(interaction, self.page + 1)
+
 
 class XP(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.xp_data = self.load_xp_data()
-        self.messages_per_level = 400  # Nombre de messages requis pour niveau up
-        # Dictionnaire pour stocker les canaux de level up par serveur
-        self.level_up_channels = {
-            "797781758841847808": 1104041737850196019,
-            "1289627804211609640": 1336777782952198274,
-        }
-
-    def load_xp_data(self):
-        if os.path.exists("xp_data.json"):
+        # Cache mémoire des compteurs (identifiant de serveur -> GuildXP) : un serveur est chargé
+        # depuis la table `xp` à son premier accès et retiré après une période d'inactivité
+        self.xp_data = {}
+        self.loading = {}
+        self.last_access = {}
+        # Réglages XP par serveur (table `xp_settings`) et courbes de niveaux correspondantes
+        self.settings = {}
+        self.curves = {}
+        self.default_curve = LevelCurve(DEFAULT_CURVE)
+        self.cooldowns = {}
+        # Cache des pages de classement déjà rendues : (serveur, page) -> (expiration, champs, nombre de pages)
+        self.leaderboard_cache = {}
+        # Classements par période déjà agrégés : (serveur, période) -> (expiration, classement)
+        self.window_rankings = {}
+        # Messages par heure en attente d'écriture : (serveur, utilisateur, heure) -> messages
+        self.activity_dirty = Counter()
+        # Écriture différée : on note les entrées (serveur, utilisateur) modifiées
+        # et on les écrit par lots dans la base au lieu d'écrire à chaque message
+        xp_config = getattr(bot, "config", {}).get("xp", {})
+        self.flush_interval = float(xp_config.get("flush_interval", DEFAULT_FLUSH_INTERVAL))
+        self.flush_max_dirty = int(xp_config.get("flush_max_dirty", DEFAULT_FLUSH_MAX_DIRTY))
+        self.leaderboard_cache_ttl = float(xp_config.get("leaderboard_cache_ttl", DEFAULT_LEADERBOARD_CACHE_TTL))
+        self.eviction_idle = float(xp_config.get("eviction_idle", DEFAULT_EVICTION_IDLE))
+        self.backfill_workers = int(xp_config.get("backfill_workers", BACKFILL_WORKERS))
+        self.backfill_page_delay = float(xp_config.get("backfill_page_delay", BACKFILL_PAGE_DELAY))
+        # Reconstructions en cours par serveur et leur avancement
+        self.backfills = {}
+        self.backfill_stats = {}
+        self.rank_card_default = bool(xp_config.get("rank_card", False))
+        # Cartes de rang déjà rendues : empreinte du contenu -> PNG
+        self.rank_cards = OrderedDict()
+        # Dernier rapport de nettoyage par serveur
+        self.prune_reports = {}
+        self.role_update_delay = float(xp_config.get("role_update_delay", ROLE_UPDATE_DELAY))
+        # Rôles de récompense par serveur (table `xp_rewards`) : serveur -> {niveau: rôle}
+        self.rewards = {}
+        # Membres dont les rôles de récompense sont à vérifier : (serveur, utilisateur) -> None.
+        # Un membre n'y figure qu'une fois, et le diff n'est calculé qu'au moment de l'appliquer
+        self.role_sync_queue = OrderedDict()
+        self.role_sync_requested = asyncio.Event()
+        # File entre les événements du gateway et le comptage : (serveur, utilisateur, horodatage)
+        self.message_queue = asyncio.Queue(int(xp_config.get("message_queue_size", MESSAGE_QUEUE_SIZE)))
+        self.message_overflow = Counter()
+        self.default_cooldown = float(xp_config.get("cooldown", DEFAULT_COOLDOWN))
+        self.cooldown_gate = CooldownGate(int(xp_config.get("cooldown_max_entries", COOLDOWN_MAX_ENTRIES)))
+        self.level_up_window = float(xp_config.get("level_up_window", LEVEL_UP_BATCH_WINDOW))
+        # Level up en attente par salon : salon -> {utilisateur: niveau atteint}
+        self.pending_level_ups = {}
+        self.level_up_tasks = {}
+        # Cache LRU des utilisateurs absents du cache des membres
+        self.user_cache = OrderedDict()
+        self.dirty = set()
+        self.flush_lock = asyncio.Lock()
+        self.flush_requested = asyncio.Event()
+        # Salons de level up par serveur, chargés depuis `xp_settings` avec les autres réglages
+        self.level_up_channels = {}
+
+    async def load_guild(self, server_id):
+        """
+        Renvoie les compteurs d'un serveur, chargés depuis la base au premier accès.
+
+        Les accès simultanés pendant le chargement attendent la même requête.
+        """
+        self.last_access[server_id] = time.monotonic()
+        guild = self.xp_data.get(server_id)
+        if guild is not None:
+            return guild
+        loading = self.loading.get(server_id)
+        if loading is None:
+            loading = self.loading[server_id] = asyncio.ensure_future(self.fetch_guild(server_id))
+        try:
+            return await asyncio.shield(loading)
+        finally:
+            if loading.done() and self.loading.get(server_id) is loading:
+                del self.loading[server_id]
+
+    async def fetch_guild(self, server_id):
+        # Le niveau n'est pas gardé en mémoire : il se déduit du compteur via la courbe du serveur
+        guild = GuildXP.from_rows(await self.bot.database.get_server_xp(server_id))
+        now = time.time()
+        guild.activity.load(
+            await self.bot.database.get_server_xp_activity(server_id, int(now // 86400) - ACTIVITY_DAYS_KEPT),
+            await self.bot.database.get_server_xp_activity_hours(server_id, int(now // 3600) - ACTIVITY_HOURS_KEPT + 1),
+        )
+        self.xp_data[server_id] = guild
+        return guild
+
+    async def import_legacy_xp_file(self, path=LEGACY_XP_FILE):
+        """Importe une seule fois l'ancien fichier xp_data.json dans la base puis le renomme"""
+        if not os.path.exists(path):
+            return
+
+        def read_file():
+            with open(path, "r") as f:
+                return json.load(f)
+
+        try:
+            legacy = await asyncio.to_thread(read_file)
+        except Exception as e:
+            # Le fichier est laissé en place pour pouvoir le corriger et relancer l'import
+            print(f"Erreur lors de l'import de {path} : {e}")
+            return
+
+        rows = []
+        for server_id, users in legacy.items():
+            if not isinstance(users, dict):
+                continue
+            for user_id, data in users.items():
+                if isinstance(data, dict) and "messages" in data:
+                    messages = int(data["messages"])
+                    rows.append((int(user_id), int(server_id), messages, self.calculate_level(messages, int(server_id))))
+
+        for i in range(0, len(rows), IMPORT_BATCH_SIZE):
+            await self.bot.database.upsert_user_xp(rows[i:i + IMPORT_BATCH_SIZE])
+        os.replace(path, path + ".imported")
+        print(f"{len(rows)} entrées XP importées depuis {path}.")
+
+    async def export_xp(self, server_id, fmt="csv"):
+        """
+        Exporte les compteurs d'un serveur en CSV ou NDJSON, ligne encodée par ligne encodée.
+
+        Les lignes sont produites au fil d'un curseur sur la table `xp`, sans copie complète en mémoire.
+        """
+        await self.flush_xp_data()
+        if fmt == "csv":
+            yield b"user_id,messages,level\n"
+        async for user_id, messages, level in self.bot.database.iter_server_xp(server_id):
+            if fmt == "csv":
+                yield f"{user_id},{messages},{level}\n".encode()
+            else:
+                yield (json.dumps({"user_id": user_id, "messages": messages, "level": level}) + "\n").encode()
+
+    async def import_xp(self, server_id, lines):
+        """
+        Fusionne un export dans les compteurs d'un serveur par lots de IMPORT_BATCH_SIZE lignes ;
+        chaque utilisateur garde le plus grand des deux compteurs.
+
+        Un lot n'est appliqué en mémoire qu'une fois écrit en base : si l'écriture échoue, l'import
+        s'arrête sans rien garder de ce lot. Renvoie le nombre d'utilisateurs mis à jour, les lignes
+        rejetées et l'erreur qui a interrompu l'import (None s'il est allé au bout).
+        """
+        errors = []
+        rows = parse_xp_export(lines, errors)
+        guild = await self.load_guild(server_id)
+        curve = self.get_curve(server_id)
+        updated = 0
+        failure = None
+        while chunk := list(itertools.islice(rows, IMPORT_BATCH_SIZE)):
+            # Un utilisateur présent plusieurs fois dans le lot garde son plus grand compteur
+            best = {}
+            for user_id, messages in chunk:
+                if messages > best.get(user_id, -1):
+                    best[user_id] = messages
+            async with self.flush_lock:
+                batch = [
+                    (user_id, server_id, messages, curve.level(messages))
+                    for user_id, messages in best.items() if messages > guild.get(user_id)
+                ]
+                try:
+                    await self.bot.database.upsert_user_xp(batch)
+                except Exception as e:
+                    failure = str(e)
+                    print(f"[XP] Import interrompu pour le serveur {server_id} : {e}")
+                    break
+                for user_id, _, messages, _ in batch:
+                    guild.set(user_id, messages)
+            updated += len(batch)
+        self.invalidate_leaderboard(server_id)
+        return updated, errors, failure
+
+    def mark_dirty(self, server_id, user_id):
+        """Note une entrée modifiée et demande une sauvegarde anticipée si le seuil est atteint"""
+        self.dirty.add((server_id, user_id))
+        if len(self.dirty) >= self.flush_max_dirty:
+            self.flush_requested.set()
+
+    async def flush_xp_data(self):
+        """Écrit en une transaction les entrées modifiées depuis la dernière sauvegarde"""
+        async with self.flush_lock:
+            if not self.dirty:
+                return
+            dirty = self.dirty
+            self.dirty = set()
+            activity = self.activity_dirty
+            self.activity_dirty = Counter()
+            # Plusieurs incréments d'un même utilisateur n'aboutissent qu'à une seule ligne écrite
+            rows = []
+            for server_id, user_id in dirty:
+                guild = self.xp_data.get(server_id)
+                if guild is not None and user_id in guild:
+                    messages = guild.get(user_id)
+                    rows.append((user_id, server_id, messages, self.calculate_level(messages, server_id)))
+            try:
+                await self.bot.database.upsert_user_xp(rows)
+            except asyncio.CancelledError:
+                self.dirty |= dirty
+                self.activity_dirty.update(activity)
+                raise
+            except Exception as e:
+                # On remet les entrées en attente pour la prochaine tentative
+                self.dirty |= dirty
+                self.activity_dirty.update(activity)
+                print(f"Erreur lors de la sauvegarde des données XP : {e}")
+                return
             try:
-                with open("xp_data.json", "r") as f:
-                    data = json.load(f)
-                print("Données XP chargées avec succès.")
-                return data
+                await self.bot.database.add_xp_activity(
+                    [(server_id, user_id, hour, messages) for (server_id, user_id, hour), messages in activity.items()]
+                )
             except Exception as e:
-                print(f"Erreur lors du chargement des données XP : {e}")
-                return {}
-        return {}
+                # L'activité n'est qu'indicative : en cas d'échec on abandonne ces incréments plutôt que de les doubler
+                print(f"Erreur lors de la sauvegarde de l'activité XP : {e}")
+
+    def discard_activity(self, server_id, user_ids):
+        """Oublie l'activité en attente d'écriture d'utilisateurs retirés, que le prochain flush réécrirait sinon"""
+        user_ids = set(user_ids)
+        if not user_ids:
+            return
+        for key in [key for key in self.activity_dirty if key[0] == server_id and key[1] in user_ids]:
+            del self.activity_dirty[key]
+
+    @tasks.loop()
+    async def flush_task(self):
+        # Se réveille soit à la fin de l'intervalle, soit dès que le seuil de modifications est atteint
+        try:
+            await asyncio.wait_for(self.flush_requested.wait(), timeout=self.flush_interval)
+        except asyncio.TimeoutError:
+            pass
+        self.flush_requested.clear()
+        await self.flush_xp_data()
 
-    def save_xp_data(self):
+    @tasks.loop(minutes=10)
+    async def compact_activity_task(self):
+        """Fusionne les buckets horaires anciens et supprime l'activité expirée, en mémoire et en base"""
+        now = time.time()
         try:
-            with open("xp_data.json", "w") as f:
-                json.dump(self.xp_data, f, indent=4)
+            for guild in self.xp_data.values():
+                guild.activity.compact(now)
+            await self.bot.database.delete_xp_activity(
+                int(now // 86400) - ACTIVITY_DAYS_KEPT, int(now // 3600) - ACTIVITY_HOURS_KEPT + 1
+            )
         except Exception as e:
-            print(f"Erreur lors de la sauvegarde des données XP : {e}")
+            # Les lignes expirées seront supprimées au prochain passage, la boucle doit continuer
+            print(f"[XP] Erreur de compactage de l'activité : {e}")
+
+    @tasks.loop(minutes=5)
+    async def evict_task(self):
+        """Retire de la mémoire les serveurs inactifs une fois leurs compteurs écrits en base"""
+        now = time.monotonic()
+        idle = [server_id for server_id in self.xp_data if now - self.last_access.get(server_id, 0) > self.eviction_idle]
+        if not idle:
+            return
+        await self.flush_xp_data()
+        async with self.flush_lock:
+            pending = {server_id for server_id, _ in self.dirty}
+            for server_id in idle:
+                if server_id in pending or now - self.last_access.get(server_id, 0) <= self.eviction_idle:
+                    continue
+                self.xp_data.pop(server_id, None)
+                self.last_access.pop(server_id, None)
+                self.invalidate_leaderboard(server_id)
+
+    async def load_settings(self):
+        """Charge une seule fois les réglages de tous les serveurs ; ils sont ensuite lus en mémoire uniquement"""
+        settings = {}
+        for server_id, key, value in await self.bot.database.get_all_xp_settings():
+            settings.setdefault(server_id, {})[key] = value
+        self.settings = settings
+        self.curves = {}
+        self.cooldowns = {}
+        self.level_up_channels = {}
+        for server_id, values in settings.items():
+            if "level_up_channel" in values:
+                self.level_up_channels[server_id] = int(values["level_up_channel"])
+            if "cooldown" in values:
+                self.cooldowns[server_id] = float(values["cooldown"])
+            if "level_curve" in values:
+                try:
+                    self.curves[server_id] = LevelCurve(json.loads(values["level_curve"]))
+                except ValueError as e:
+                    print(f"[XP] Courbe invalide pour le serveur {server_id} : {e}")
+        self.update_cooldown_horizon()
+        self.rewards = {}
+        for server_id, level, role_id in await self.bot.database.get_all_xp_rewards():
+            self.rewards.setdefault(server_id, {})[level] = role_id
+
+    def update_cooldown_horizon(self):
+        self.cooldown_gate.horizon = max([self.default_cooldown, *self.cooldowns.values()])
+
+    async def set_setting(self, server_id, key, value):
+        """Écrit un réglage dans la base puis met à jour le cache mémoire"""
+        await self.bot.database.set_xp_setting(server_id, key, value)
+        self.settings.setdefault(server_id, {})[key] = value
+
+    async def delete_setting(self, server_id, key):
+        await self.bot.database.delete_xp_setting(server_id, key)
+        self.settings.get(server_id, {}).pop(key, None)
+
+    async def cog_load(self):
+        await self.load_settings()
+        await self.import_legacy_xp_file()
+        self.message_task.start()
+        self.flush_task.start()
+        self.compact_activity_task.start()
+        self.evict_task.start()
+        self.role_sync_task.start()
+        self.prune_task.start()
+        self.backfills[None] = asyncio.create_task(self.resume_backfills())
 
-    def calculate_level(self, messages):
-        """Calcule le niveau basé sur le nombre de messages (1 niveau tous les 400 messages)"""
-        return (messages // self.messages_per_level) + 1
+    async def cog_unload(self):
+        # Les reconstructions reprendront depuis leur dernier point de reprise
+        for task in self.backfills.values():
+            task.cancel()
+        self.message_task.cancel()
+        self.flush_task.cancel()
+        self.compact_activity_task.cancel()
+        self.evict_task.cancel()
+        # Les rôles encore en file seront corrigés par la prochaine resynchronisation
+        self.role_sync_task.cancel()
+        self.prune_task.cancel()
+        # Les level up en attente sont envoyés tout de suite plutôt que perdus
+        for channel_id, task in list(self.level_up_tasks.items()):
+            task.cancel()
+        for channel_id in list(self.pending_level_ups):
+            await self.send_level_ups(channel_id, 0)
+        # Les messages encore en file sont comptés avant la dernière sauvegarde
+        batch = []
+        while not self.message_queue.empty():
+            batch.append(self.message_queue.get_nowait())
+        await self.apply_messages(batch)
+        # Sauvegarde forcée pour ne rien perdre au déchargement ou à l'arrêt du bot
+        await self.flush_xp_data()
 
-    def calculate_messages_for_next_level(self, messages):
+    def get_curve(self, server_id):
+        return self.curves.get(server_id, self.default_curve)
+
+    def calculate_level(self, messages, server_id=None):
+        """Calcule le niveau correspondant au nombre de messages selon la courbe du serveur"""
+        return self.get_curve(server_id).level(messages)
+
+    def calculate_messages_for_next_level(self, messages, server_id=None):
         """Calcule le nombre de messages restants pour le prochain niveau"""
-        current_level = self.calculate_level(messages)
-        messages_needed = (current_level * self.messages_per_level)
-        return messages_needed - messages
+        return self.get_curve(server_id).messages_for_next_level(messages)
+
+    async def set_level_curve(self, server_id, curve):
+        """Change la courbe d'un serveur et recalcule en une requête les niveaux stockés de tout le serveur"""
+        async with self.flush_lock:
+            await self.set_setting(server_id, "level_curve", json.dumps(curve.spec))
+            self.curves[server_id] = curve
+            guild = await self.load_guild(server_id)
+            highest = max(guild.rank_index.buckets, default=0)
+            await self.bot.database.relevel_xp(server_id, curve.thresholds_up_to(highest))
+            self.invalidate_leaderboard(server_id)
+            return len(guild)
 
-    async def add_message(self, user_id, guild_id):
+    async def add_message(self, user_id, server_id, timestamp=None):
         """Ajoute un message au compteur de l'utilisateur"""
-        server_id = str(guild_id)
-        user_id = str(user_id)
+        timestamp = timestamp or time.time()
+        guild = self.xp_data.get(server_id)
+        if guild is None:
+            guild = await self.load_guild(server_id)
+        else:
+            self.last_access[server_id] = time.monotonic()
+        # Incrémente le compteur de messages (l'index de classement suit) et l'activité de l'heure
+        messages = guild.increment(user_id)
+        guild.activity.add(user_id, timestamp)
+        self.activity_dirty[(server_id, user_id, int(timestamp // 3600))] += 1
+        curve = self.get_curve(server_id)
+        new_level = curve.level(messages)
+
+        # Vérifie si l'utilisateur a gagné un niveau (le message a franchi un seuil de la courbe)
+        old_level = curve.level(messages - 1)
+        if new_level > old_level:
+            self.notify_level_up(user_id, server_id, new_level)
+            rewards = self.rewards.get(server_id)
+            if rewards and any(old_level < level <= new_level for level in rewards):
+                self.queue_role_sync(server_id, user_id, urgent=True)
+
+        self.mark_dirty(server_id, user_id)
+
+    async def apply_messages(self, batch):
+        for server_id, user_id, timestamp in batch:
+            try:
+                await self.add_message(user_id, server_id, timestamp)
+            except Exception as e:
+                print(f"[XP] Message de {user_id} non compté sur le serveur {server_id} : {e}")
+
+    @tasks.loop()
+    async def message_task(self):
+        """Compte les messages en file par lots, en dehors du traitement des événements du gateway"""
+        batch = [await self.message_queue.get()]
+        while len(batch) < MESSAGE_BATCH_SIZE and not self.message_queue.empty():
+            batch.append(self.message_queue.get_nowait())
+        await self.apply_messages(batch)
+
+    def prune_settings(self, server_id):
+        value = self.settings.get(server_id, {}).get("prune")
+        return json.loads(value) if value else {}
+
+    def export_size(self, guild, server_id):
+        """Taille de l'export CSV des compteurs d'un serveur, sans le produire"""
+        curve = self.get_curve(server_id)
+        return sum(len(f"{user_id},{messages},{curve.level(messages)}\n") for user_id, messages in guild.items())
+
+    async def prune_guild(self, server_id, now=None, force=False):
+        """
+        Passe de nettoyage d'un serveur.
+
+        Supprime les petits compteurs des membres qui ont quitté le serveur, fait perdre une part de leurs
+        messages aux membres inactifs (d'après les buckets d'activité), puis reconstruit les structures
+        du serveur au plus juste. Renvoie ce que la passe a libéré en mémoire et à l'export, ou None si
+        la dernière passe date de moins de PRUNE_INTERVAL et que `force` n'est pas demandé.
+        """
+        now = now or time.time()
+        config = self.prune_settings(server_id)
+        # La date de la dernière passe est sauvegardée : un redémarrage n'applique pas la décroissance une fois de plus
+        if not force and now - config.get("last_run", 0) < PRUNE_INTERVAL:
+            return None
+        guild = await self.load_guild(server_id)
+        discord_guild = self.bot.get_guild(server_id)
+        async with self.flush_lock:
+            report = Counter(memory=guild.nbytes(), serialized=self.export_size(guild, server_id))
+            removed, decayed = [], []
+            # Sans la liste complète des membres, impossible de savoir qui est parti
+            below = config.get("below", 0)
+            if below and discord_guild is not None and discord_guild.chunked:
+                removed = [
+                    user_id for user_id, messages in guild.items()
+                    if messages < below and discord_guild.get_member(user_id) is None
+                ]
+            # L'activité n'est connue que depuis l'activation : personne n'est déclaré inactif avant d'avoir pu l'être
+            days, percent = config.get("decay_days", 0), config.get("decay_percent", 0)
+            if days and percent and now - config.get("since", now) >= days * 86400:
+                active = guild.activity.totals(days * 86400, now)
+                removing = set(removed)
+                for user_id, messages in guild.items():
+                    if user_id not in active and user_id not in removing:
+                        messages -= max(1, int(messages * percent / 100))
+                        if messages > 0:
+                            decayed.append((user_id, messages))
+                        else:
+                            removed.append(user_id)
+
+            for user_id in removed:
+                guild.remove(user_id)
+                self.dirty.discard((server_id, user_id))
+            self.discard_activity(server_id, removed)
+            for user_id, messages in decayed:
+                guild.set(user_id, messages)
+            if removed:
+                # Remplacé avant toute attente : les messages suivants arrivent dans la nouvelle copie
+                guild = self.xp_data[server_id] = guild.compacted()
+            self.invalidate_leaderboard(server_id)
+
+            curve = self.get_curve(server_id)
+            await self.bot.database.delete_users_xp(server_id, removed)
+            await self.bot.database.upsert_user_xp(
+                [(user_id, server_id, messages, curve.level(messages)) for user_id, messages in decayed]
+            )
+            report["memory"] -= guild.nbytes()
+            report["serialized"] -= self.export_size(guild, server_id)
+            report["removed"] = len(removed)
+            report["decayed"] = len(decayed)
 
-        # Initialise la structure de données si elle n'existe pas
-        if server_id not in self.xp_data:
-            self.xp_data[server_id] = {}
+        # Relu : la configuration a pu changer par /xpprune pendant la passe
+        config = self.prune_settings(server_id)
+        if config:
+            config["last_run"] = now
+            await self.set_setting(server_id, "prune", json.dumps(config))
+        if decayed and server_id in self.rewards and discord_guild is not None:
+            await self.resync_rewards(discord_guild)
+        self.prune_reports[server_id] = report
+        print(
+            f"[XP] Nettoyage du serveur {server_id} : {len(removed)} supprimés, {len(decayed)} réduits, "
+            f"{report['memory']} octets libérés en mémoire, {report['serialized']} à l'export"
+        )
+        return report
 
-        # Structure de données par défaut pour un nouvel utilisateur
-        default_data = {
-            "messages": 0,
-            "level": 1
-        }
+    @tasks.loop(hours=1)
+    async def prune_task(self):
+        """Passe quotidienne, uniquement pour les serveurs qui ont configuré le nettoyage ou la décroissance ; vérifiée toutes les heures"""
+        for server_id in [server_id for server_id, values in self.settings.items() if "prune" in values]:
+            try:
+                await self.prune_guild(server_id)
+            except Exception as e:
+                print(f"[XP] Erreur de nettoyage pour le serveur {server_id} : {e}")
 
-        # Initialise ou récupère les données de l'utilisateur
-        if user_id not in self.xp_data[server_id]:
-            self.xp_data[server_id][user_id] = default_data.copy()
+    @prune_task.before_loop
+    async def before_prune_task(self):
+        # La liste des membres doit être disponible pour savoir qui est parti
+        await self.bot.wait_until_ready()
 
-        # Incrémente le compteur de messages
-        self.xp_data[server_id][user_id]["messages"] += 1
-        messages = self.xp_data[server_id][user_id]["messages"]
-        current_level = self.xp_data[server_id][user_id]["level"]
-        new_level = self.calculate_level(messages)
+    def reward_roles_diff(self, member, level):
+        """Renvoie les rôles de récompense à ajouter et à retirer ; les autres rôles du membre ne sont jamais touchés"""
+        rewards = self.rewards.get(member.guild.id, {})
+        expected = {role_id for reward_level, role_id in rewards.items() if reward_level <= level}
+        current = {role.id for role in member.roles}
+        return expected - current, (set(rewards.values()) - expected) & current
 
-        # Vérifie si l'utilisateur a gagné un niveau
-        if new_level > current_level:
-            self.xp_data[server_id][user_id]["level"] = new_level
-            await self.notify_level_up(user_id, server_id, new_level)
+    def queue_role_sync(self, server_id, user_id, urgent=False):
+        key = (server_id, user_id)
+        self.role_sync_queue[key] = None
+        if urgent:
+            # Un level up passe devant une resynchronisation complète en cours
+            self.role_sync_queue.move_to_end(key, last=False)
+        self.role_sync_requested.set()
 
-        self.save_xp_data()
+    async def resync_rewards(self, guild):
+        """
+        Compare les rôles attendus de tous les membres en cache à leurs rôles actuels.
 
-    async def notify_level_up(self, user_id, server_id, new_level):
+        Seuls les membres dont les rôles diffèrent sont mis en file : aucun appel à l'API n'est fait ici.
+        """
+        xp = await self.load_guild(guild.id)
+        curve = self.get_curve(guild.id)
+        queued = 0
+        for member in guild.members:
+            if member.bot:
+                continue
+            to_add, to_remove = self.reward_roles_diff(member, curve.level(xp.get(member.id)))
+            if to_add or to_remove:
+                self.queue_role_sync(guild.id, member.id)
+                queued += 1
+        return queued
+
+    async def apply_reward_roles(self, server_id, user_id):
+        """Applique le diff de rôles d'un membre et renvoie le nombre d'appels à l'API effectués"""
+        guild = self.bot.get_guild(server_id)
+        member = guild.get_member(user_id) if guild else None
+        if member is None:
+            return 0
+        xp = await self.load_guild(server_id)
+        to_add, to_remove = self.reward_roles_diff(member, self.calculate_level(xp.get(user_id), server_id))
+        to_add = [role for role in map(guild.get_role, to_add) if role]
+        to_remove = [role for role in map(guild.get_role, to_remove) if role]
         try:
-            channel_id = self.level_up_channels.get(server_id)
-            if not channel_id:
-                return
+            if to_add:
+                await member.add_roles(*to_add, reason="Level reward")
+            if to_remove:
+                await member.remove_roles(*to_remove, reason="Level reward")
+        except discord.HTTPException as e:
+            print(f"[XP] Impossible de modifier les rôles de {user_id} sur le serveur {server_id} : {e}")
+        # discord.py fait un appel par rôle
+        return len(to_add) + len(to_remove)
+
+    @tasks.loop()
+    async def role_sync_task(self):
+        """Vide la file des rôles un membre à la fois, en espaçant les appels pour ne jamais rafaler l'API"""
+        await self.role_sync_requested.wait()
+        while self.role_sync_queue:
+            (server_id, user_id), _ = self.role_sync_queue.popitem(last=False)
+            try:
+                calls = await self.apply_reward_roles(server_id, user_id)
+            except Exception as e:
+                print(f"[XP] Erreur de synchronisation des rôles : {e}")
+                continue
+            if calls:
+                await asyncio.sleep(self.role_update_delay * calls)
+        self.role_sync_requested.clear()
+
+    async def backfill_guild(self, guild, restart=False):
+        """
+        Reconstruit les compteurs d'un serveur à partir de l'historique de ses salons textuels.
 
+        Les salons sont répartis entre quelques workers ; chaque salon enregistre régulièrement en
+        base son dernier message lu et les comptes accumulés, ce qui permet de reprendre une
+        reconstruction interrompue. Les comptes sont fusionnés dans le stockage XP en une fois à la fin.
+        """
+        server_id = guild.id
+        database = self.bot.database
+        if restart:
+            # Sans point d'arrêt, une nouvelle reconstruction efface la précédente
+            await self.delete_setting(server_id, "backfill_cutoff")
+
+        # Les messages postérieurs au lancement sont déjà comptés en direct : l'historique s'arrête là,
+        # et les compteurs à cet instant sont notés pour retrouver à la fusion ce qui a été compté depuis
+        cutoff = self.settings.get(server_id, {}).get("backfill_cutoff")
+        if cutoff is None:
+            xp_guild = await self.load_guild(server_id)
+            cutoff = str(discord.utils.time_snowflake(discord.utils.utcnow()))
+            baseline = list(xp_guild.items())
+            await database.clear_xp_backfill(server_id)
+            await database.save_xp_backfill_baseline(server_id, baseline)
+            await self.set_setting(server_id, "backfill_cutoff", cutoff)
+
+        progress = await database.get_xp_backfill_channels(server_id)
+        queue = asyncio.Queue()
+        for channel in guild.text_channels:
+            last_message_id, done = progress.get(channel.id, (None, False))
+            if not done and channel.permissions_for(guild.me).read_message_history:
+                queue.put_nowait((channel, last_message_id))
+
+        stats = self.backfill_stats[server_id] = Counter(channels=queue.qsize())
+        # L'historique est compté avec le même cooldown que les messages en direct
+        cooldown = self.cooldowns.get(server_id, self.default_cooldown)
+        workers = [
+            asyncio.create_task(self.backfill_worker(queue, server_id, int(cutoff), cooldown, stats))
+            for _ in range(min(self.backfill_workers, queue.qsize()))
+        ]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            for worker in workers:
+                worker.cancel()
+            raise
+
+        stats["merged"] = await self.merge_backfill(server_id)
+        await database.clear_xp_backfill(server_id)
+        await self.delete_setting(server_id, "backfill_cutoff")
+        if stats["merged"] and server_id in self.rewards:
+            # Les niveaux ont changé : les rôles de récompense suivent
+            await self.resync_rewards(guild)
+        return stats
+
+    async def backfill_worker(self, queue, server_id, cutoff, cooldown, stats):
+        while not queue.empty():
+            channel, last_message_id = queue.get_nowait()
+            await self.backfill_channel(channel, server_id, last_message_id, cutoff, cooldown, stats)
+            stats["channels_done"] += 1
+
+    async def backfill_channel(self, channel, server_id, last_message_id, cutoff, cooldown, stats):
+        counts = Counter()
+        # Date du dernier message compté par auteur, pour appliquer le cooldown dans l'ordre chronologique du salon
+        last_counted = {}
+        scanned = 0
+        after = discord.Object(id=last_message_id) if last_message_id else None
+        try:
+            async for message in channel.history(
+                limit=None, after=after, before=discord.Object(id=cutoff), oldest_first=True
+            ):
+                last_message_id = message.id
+                scanned += 1
+                if not message.author.bot:
+                    created = message.created_at.timestamp()
+                    last = last_counted.get(message.author.id)
+                    if last is None or created - last >= cooldown:
+                        last_counted[message.author.id] = created
+                        counts[message.author.id] += 1
+                if scanned % 100 == 0:
+                    # Une page d'historique = une requête : on espace les pages pour laisser de la marge aux autres appels
+                    await asyncio.sleep(self.backfill_page_delay)
+                if scanned >= BACKFILL_CHECKPOINT_EVERY:
+                    await self.bot.database.save_xp_backfill_checkpoint(
+                        server_id, channel.id, last_message_id, False, list(counts.items())
+                    )
+                    stats["messages"] += scanned
+                    counts.clear()
+                    scanned = 0
+        except discord.Forbidden:
+            pass
+        await self.bot.database.save_xp_backfill_checkpoint(
+            server_id, channel.id, last_message_id or 0, True, list(counts.items())
+        )
+        stats["messages"] += scanned
+
+    async def merge_backfill(self, server_id):
+        """
+        Fusionne en une passe les comptes reconstruits, qui s'arrêtent au lancement : chaque utilisateur
+        reçoit l'historique plus les messages comptés en direct depuis, sans jamais descendre sous son compteur actuel.
+        """
+        rows = await self.bot.database.get_xp_backfill_counts(server_id)
+        guild = await self.load_guild(server_id)
+        curve = self.get_curve(server_id)
+        async with self.flush_lock:
+            updated = []
+            for user_id, rebuilt, live_at_cutoff in rows:
+                live = guild.get(user_id)
+                messages = rebuilt + live - live_at_cutoff
+                if messages > live:
+                    guild.set(user_id, messages)
+                    updated.append((user_id, server_id, messages, curve.level(messages)))
+            await self.bot.database.upsert_user_xp(updated)
+            self.invalidate_leaderboard(server_id)
+        return len(updated)
+
+    async def run_backfill(self, guild, channel=None, restart=False):
+        try:
+            stats = await self.backfill_guild(guild, restart)
+            message = (
+                f"XP backfill finished: {stats['messages']} messages scanned in {stats['channels_done']} channels, "
+                f"{stats['merged']} members updated."
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            message = f"XP backfill interrupted ({e}), run /xpbackfill again to resume it."
+            print(f"[XP] Erreur de reconstruction pour le serveur {guild.id} : {e}")
+        finally:
+            self.backfills.pop(guild.id, None)
+        if channel is not None:
+            try:
+                await channel.send(message)
+            except discord.HTTPException:
+                pass
+
+    async def resume_backfills(self):
+        """Relance au démarrage les reconstructions interrompues par un arrêt du bot"""
+        await self.bot.wait_until_ready()
+        for server_id, values in self.settings.items():
+            guild = self.bot.get_guild(server_id)
+            if "backfill_cutoff" in values and guild is not None and server_id not in self.backfills:
+                self.backfills[server_id] = asyncio.create_task(self.run_backfill(guild))
+        self.backfills.pop(None, None)
+
+    def notify_level_up(self, user_id, server_id, new_level):
+        """Met le level up en attente ; ceux d'un même salon sont envoyés ensemble après une courte fenêtre"""
+        channel_id = self.level_up_channels.get(server_id)
+        if not channel_id:
+            return
+        pending = self.pending_level_ups.setdefault(channel_id, {})
+        pending[user_id] = new_level
+        if channel_id not in self.level_up_tasks:
+            self.level_up_tasks[channel_id] = asyncio.create_task(self.send_level_ups(channel_id, self.level_up_window))
+
+    async def resolve_user(self, guild, user_id):
+        """Résout un utilisateur depuis le cache des membres, puis un cache LRU, et en dernier recours l'API"""
+        member = guild.get_member(user_id) if guild else None
+        if member:
+            return member
+        user = self.user_cache.get(user_id)
+        if user is not None:
+            self.user_cache.move_to_end(user_id)
+            return user
+        user = self.bot.get_user(user_id)
+        if user is None:
+            try:
+                user = await self.bot.fetch_user(user_id)
+            except discord.NotFound:
+                return None
+        self.user_cache[user_id] = user
+        if len(self.user_cache) > USER_CACHE_SIZE:
+            self.user_cache.popitem(last=False)
+        return user
+
+    async def send_level_ups(self, channel_id, delay):
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self.level_up_tasks.pop(channel_id, None)
+        pending = self.pending_level_ups.pop(channel_id, {})
+        try:
             channel = self.bot.get_channel(channel_id)
-            if not channel:
+            if not channel or not pending:
                 return
 
-            user = await self.bot.fetch_user(int(user_id))
-            if not user:
+            lines = []
+            for user_id, level in pending.items():
+                user = await self.resolve_user(channel.guild, user_id)
+                if user:
+                    lines.append((user, level))
+
+            if len(lines) == 1:
+                user, level = lines[0]
+                embed = discord.Embed(
+                    title="🎉 Level Up!",
+                    description=f"{user.mention} has reached level {level}!",
+                    color=discord.Color.gold()
+                )
+                embed.set_thumbnail(url=user.display_avatar.url)
+                await channel.send(embed=embed)
                 return
 
-            embed = discord.Embed(
-                title="🎉 Level Up!",
-                description=f"{user.mention} has reached level {new_level}!",
-                color=discord.Color.gold()
-            )
-            embed.set_thumbnail(url=user.display_avatar.url)
-            await channel.send(embed=embed)
+            # Plusieurs level up : un seul message, découpé en embeds de taille raisonnable
+            embeds = []
+            for start in range(0, len(lines), LEVEL_UP_LINES_PER_EMBED):
+                chunk = lines[start:start + LEVEL_UP_LINES_PER_EMBED]
+                embeds.append(discord.Embed(
+                    title="🎉 Level Up!" if start == 0 else None,
+                    description="\n".join(f"{user.mention} has reached level {level}!" for user, level in chunk),
+                    color=discord.Color.gold()
+                ))
+            # Les embeds sont regroupés tant que le message reste sous les limites de Discord
+            group, size = [], 0
+            for embed in embeds:
+                if group and (len(group) == MESSAGE_MAX_EMBEDS or size + len(embed) > MESSAGE_MAX_EMBED_CHARS):
+                    await channel.send(embeds=group)
+                    group, size = [], 0
+                group.append(embed)
+                size += len(embed)
+            await channel.send(embeds=group)
 
         except Exception as e:
             print(f"[XP] Erreur notification: {e}")
@@ -106,34 +1364,39 @@ class XP(commands.Cog):
     async def on_message(self, message):
         if message.author.bot or not message.guild:
             return
-        await self.add_message(message.author.id, message.guild.id)
+        # Le filtre anti-spam passe avant toute autre opération
+        server_id = message.guild.id
+        cooldown = self.cooldowns.get(server_id, self.default_cooldown)
+        if not self.cooldown_gate.allow(server_id, message.author.id, cooldown, time.monotonic()):
+            return
+        # Mise en file en temps constant : le comptage et l'écriture se font dans message_task
+        try:
+            self.message_queue.put_nowait((server_id, message.author.id, time.time()))
+        except asyncio.QueueFull:
+            self.message_overflow[server_id] += 1
 
     @app_commands.command(
         name="rank",
         description="Display your rank or another user's rank and progress"
     )
     @app_commands.describe(
-        user="The user to check (leave empty to see your own rank)"
+        user="The user to check (leave empty to see your own rank)",
+        card="Show the rank as an image card instead of text"
     )
-    async def rank(self, interaction: discord.Interaction, user: discord.Member = None):
-        server_id = str(interaction.guild_id)
+    async def rank(self, interaction: discord.Interaction, user: discord.Member = None, card: bool = None):
+        server_id = interaction.guild_id
         target_user = user or interaction.user
-        user_id = str(target_user.id)
-
-        # Initialize default data
-        default_data = {
-            "messages": 0,
-            "level": 1
-        }
+        card = (self.rank_card_default if card is None else card) and Image is not None
+        if card:
+            # Téléchargement de l'avatar et rendu peuvent dépasser les 3 secondes accordées pour répondre
+            await interaction.response.defer()
 
         # Get user data or use default
-        if server_id not in self.xp_data:
-            self.xp_data[server_id] = {}
-        
-        data = self.xp_data[server_id].get(user_id, default_data)
-        messages = data["messages"]
-        level = self.calculate_level(messages)
-        next_level_messages = self.calculate_messages_for_next_level(messages)
+        guild = await self.load_guild(server_id)
+        messages = guild.get(target_user.id)
+        curve = self.get_curve(server_id)
+        level = curve.level(messages)
+        next_level_messages = curve.messages_for_next_level(messages)
 
         embed = discord.Embed(
             title=f"📊 Statistics for {target_user.display_name}",
@@ -141,17 +1404,22 @@ class XP(commands.Cog):
         )
         embed.set_thumbnail(url=target_user.display_avatar.url)
         
-        # Trouve le rang de l'utilisateur
-        all_users = [(uid, udata) for uid, udata in self.xp_data[server_id].items()]
-        sorted_users = sorted(all_users, key=lambda x: (x[1].get("level", 1), x[1].get("messages", 0)), reverse=True)
-        rank = next((index + 1 for index, (uid, _) in enumerate(sorted_users) if uid == user_id), 0)
+        # Trouve le rang de l'utilisateur en O(log n) grâce à l'index de classement
+        rank = guild.rank_index.rank_of(messages)
+
+        if card:
+            data = await self.rank_card(target_user, level, curve.progress(messages))
+            embed.description = f"Rank **#{rank}** | {messages} messages | {next_level_messages} left for level {level + 1}"
+            embed.set_image(url="attachment://rank.png")
+            await interaction.followup.send(embed=embed, file=discord.File(io.BytesIO(data), "rank.png"))
+            return
         
         embed.add_field(name="Rank", value=f"```#{rank}```", inline=True)
         embed.add_field(name="Level", value=f"```{level}```", inline=True)
         embed.add_field(name="Messages", value=f"```{messages}```", inline=True)
         
         # Barre de progression
-        progress = (messages % self.messages_per_level) / self.messages_per_level
+        progress = curve.progress(messages)
         bar_length = 10
         filled = int(progress * bar_length)
         bar = "█" * filled + "░" * (bar_length - filled)
@@ -164,56 +1432,200 @@ class XP(commands.Cog):
 
         await interaction.response.send_message(embed=embed)
 
-    @app_commands.command(name="leaderboard", description="Displays server ranking")
-    async def leaderboard(self, interaction: discord.Interaction):
-        server_id = str(interaction.guild_id)
-        
-        if server_id not in self.xp_data:
-            await interaction.response.send_message("Aucune donnée pour ce serveur!", ephemeral=True)
-            return
+    async def rank_card(self, user, level, progress):
+        """
+        Renvoie la carte de rang PNG d'un utilisateur.
+
+        Les cartes sont mises en cache par empreinte de leur contenu (avatar, nom, niveau, palier de progression) :
+        tant que rien de visible ne change, les appels suivants resservent les mêmes octets sans rendu ni téléchargement.
+        """
+        step = int(progress * RANK_CARD_PROGRESS_STEPS)
+        key = hashlib.sha1(f"{user.display_avatar.key}:{user.display_name}:{level}:{step}".encode()).hexdigest()
+        data = self.rank_cards.get(key)
+        if data is not None:
+            self.rank_cards.move_to_end(key)
+            return data
+
+        try:
+            avatar = await user.display_avatar.replace(size=128, static_format="png").read()
+        except discord.HTTPException:
+            avatar = None
+        data = await asyncio.to_thread(
+            render_rank_card, avatar, user.display_name, level, step / RANK_CARD_PROGRESS_STEPS
+        )
+        self.rank_cards[key] = data
+        if len(self.rank_cards) > RANK_CARD_CACHE_SIZE:
+            self.rank_cards.popitem(last=False)
+        return data
+
+    def window_ranking(self, server_id, period):
+        """
+        Classement (utilisateur, messages) sur une période glissante, trié du plus actif au moins actif,
+        accompagné des compteurs négatifs pour retrouver par bisect le rang partagé des ex aequo.
+        """
+        now = time.monotonic()
+        cached = self.window_rankings.get((server_id, period))
+        if cached and cached[0] > now:
+            return cached[1], cached[2]
+        guild = self.xp_data.get(server_id)
+        totals = guild.activity.totals(ACTIVITY_PERIODS[period], time.time()) if guild else Counter()
+        ranking = sorted(totals.items(), key=lambda item: item[1], reverse=True)
+        keys = [-messages for _, messages in ranking]
+        self.window_rankings[(server_id, period)] = (now + self.leaderboard_cache_ttl, ranking, keys)
+        return ranking, keys
 
-        # Filtre les utilisateurs avec des données valides
-        valid_users = []
-        for user_id, data in self.xp_data[server_id].items():
-            if isinstance(data, dict) and "messages" in data and "level" in data:
-                valid_users.append((user_id, data))
+    def ranking_size(self, server_id, period="all"):
+        if period == "all":
+            guild = self.xp_data.get(server_id)
+            return len(guild) if guild else 0
+        return len(self.window_ranking(server_id, period)[0])
 
-        # Trie les utilisateurs valides
-        sorted_users = sorted(
-            valid_users,
-            key=lambda x: (x[1].get("level", 1), x[1].get("messages", 0)),
-            reverse=True
-        )[:10]
+    def page_count(self, server_id, period="all"):
+        return max(1, math.ceil(self.ranking_size(server_id, period) / LEADERBOARD_PAGE_SIZE))
 
+    def ranking_entries(self, server_id, period, start, limit):
+        """Tuples (rang, utilisateur, messages) du classement à partir de la position `start`"""
+        if period == "all":
+            # Le classement général est lu directement dans l'index, sans tri
+            guild = self.xp_data.get(server_id)
+            return guild.rank_index.entries(start, limit) if guild else []
+        ranking, keys = self.window_ranking(server_id, period)
+        entries = []
+        for user_id, messages in ranking[start - 1:start - 1 + limit]:
+            # Les ex aequo partagent le rang du premier d'entre eux
+            entries.append((bisect.bisect_left(keys, -messages) + 1, user_id, messages))
+        return entries
+
+    def leaderboard_page(self, guild, page, period="all"):
+        """Renvoie les champs d'une page du classement et le nombre de pages, avec un cache de courte durée"""
+        server_id = guild.id
+        key = (server_id, page, period)
+        now = time.monotonic()
+        cached = self.leaderboard_cache.get(key)
+        if cached and cached[0] > now:
+            return cached[1], cached[2]
+
+        curve = self.get_curve(server_id)
+        page_count = self.page_count(server_id, period)
+        fields = []
+        for rank, user_id, messages in self.ranking_entries(
+            server_id, period, (page - 1) * LEADERBOARD_PAGE_SIZE + 1, LEADERBOARD_PAGE_SIZE
+        ):
+            member = guild.get_member(user_id)
+            name = member.display_name if member else "Unknown member"
+            medal = {1: "🥇", 2: "🥈", 3: "🥉"}.get(rank, "")
+            if period == "all":
+                value = f"Level {curve.level(messages)} | {messages} messages"
+            else:
+                value = f"{messages} messages"
+            fields.append((f"{medal} #{rank} {name}", value))
+
+        if len(self.leaderboard_cache) >= LEADERBOARD_CACHE_MAX:
+            self.leaderboard_cache = {k: v for k, v in self.leaderboard_cache.items() if v[0] > now}
+        self.leaderboard_cache[key] = (now + self.leaderboard_cache_ttl, fields, page_count)
+        return fields, page_count
+
+    def build_leaderboard_embed(self, guild, page, period="all"):
+        fields, page_count = self.leaderboard_page(guild, page, period)
+        title = f"🏆 Ranking of - {guild.name}"
+        if period != "all":
+            title += f" ({period})"
         embed = discord.Embed(
-            title=f"🏆 Ranking of - {interaction.guild.name}",
+            title=title,
             color=discord.Color.gold()
         )
-
-        if not sorted_users:
+        if not fields:
             embed.description = "No valid data to display"
-        else:
-            for rank, (user_id, data) in enumerate(sorted_users, 1):
-                user = interaction.guild.get_member(int(user_id))
-                if user:
-                    medal = {1: "🥇", 2: "🥈", 3: "🥉"}.get(rank, "")
-                    embed.add_field(
-                        name=f"{medal} #{rank} {user.display_name}",
-                        value=f"Level {data.get('level', 1)} | {data.get('messages', 0)} messages",
-                        inline=False
-                    )
+        for name, value in fields:
+            embed.add_field(name=name, value=value, inline=False)
+        embed.set_footer(text=f"Page {page}/{page_count}")
+        return embed, page_count
+
+    def invalidate_leaderboard(self, server_id):
+        self.leaderboard_cache = {k: v for k, v in self.leaderboard_cache.items() if k[0] != server_id}
+        self.window_rankings = {k: v for k, v in self.window_rankings.items() if k[0] != server_id}
 
+    @app_commands.command(name="xpstats", description="Shows how messages are distributed among the members")
+    @app_commands.describe(user="Also show where this user sits in the distribution")
+    async def xpstats(self, interaction: discord.Interaction, user: discord.Member = None):
+        guild = await self.load_guild(interaction.guild_id)
+        index = guild.rank_index
+        if not index.total:
+            await interaction.response.send_message("Aucune donnée pour ce serveur!", ephemeral=True)
+            return
+
+        # Quantiles exacts lus dans l'index de classement, sans tri
+        embed = discord.Embed(title=f"📈 Message distribution - {interaction.guild.name}", color=0xBEBEFE)
+        embed.add_field(name="Members", value=f"```{index.total}```", inline=True)
+        embed.add_field(name="Median", value=f"```{index.quantile(0.5)}```", inline=True)
+        embed.add_field(
+            name="p90 | p99 | max",
+            value=f"```{index.quantile(0.9)} | {index.quantile(0.99)} | {index.quantile(1)}```",
+            inline=True
+        )
+        if user is not None:
+            messages = guild.get(user.id)
+            embed.add_field(
+                name=user.display_name,
+                value=f"{messages} messages, more than {index.percentile_of(messages - 1):.1%} of the members "
+                      f"(rank #{index.rank_of(messages)})" if messages else "No messages yet",
+                inline=False
+            )
+
+        # Paliers d'activité : un par puissance de deux, lus dans l'histogramme
+        tiers = []
+        largest = max(index.histogram)
+        for bucket, users in enumerate(index.histogram):
+            if users:
+                low, high = 1 << (bucket - 1), (1 << bucket) - 1
+                label = f"{low}" if low == high else f"{low}-{high}"
+                bar = "█" * max(1, round(users / largest * 10))
+                tiers.append(f"`{label:>13}` {bar} {users}")
+        embed.add_field(name="Activity tiers (messages)", value="\n".join(tiers), inline=False)
         await interaction.response.send_message(embed=embed)
 
+    @app_commands.command(name="leaderboard", description="Displays server ranking")
+    @app_commands.describe(
+        page="The page of the ranking to display",
+        period="Rank by all-time messages or by activity over the last day, week or month",
+    )
+    @app_commands.choices(period=[
+        app_commands.Choice(name=name, value=name) for name in ("all", *ACTIVITY_PERIODS)
+    ])
+    async def leaderboard(
+        self,
+        interaction: discord.Interaction,
+        page: app_commands.Range[int, 1] = 1,
+        period: app_commands.Choice[str] = None,
+    ):
+        server_id = interaction.guild_id
+        period = period.value if period else "all"
+        
+        if not await self.load_guild(server_id):
+            await interaction.response.send_message("Aucune donnée pour ce serveur!", ephemeral=True)
+            return
+
+        page = min(page, self.page_count(server_id, period))
+        embed, page_count = self.build_leaderboard_embed(interaction.guild, page, period)
+        view = LeaderboardView(self, interaction.user, interaction.guild, page, page_count, period)
+        await interaction.response.send_message(embed=embed, view=view)
+
     @app_commands.command(name="resetxp", description="Resets a member's XP")
     @app_commands.checks.has_permissions(administrator=True)
     async def resetxp(self, interaction: discord.Interaction, member: discord.Member):
-        server_id = str(interaction.guild_id)
-        user_id = str(member.id)
+        server_id = interaction.guild_id
+        user_id = member.id
 
-        if server_id in self.xp_data and user_id in self.xp_data[server_id]:
-            self.xp_data[server_id][user_id] = {"messages": 0, "level": 1}
-            self.save_xp_data()
+        guild = await self.load_guild(server_id)
+        if user_id in guild:
+            async with self.flush_lock:
+                guild.remove(user_id)
+                self.invalidate_leaderboard(server_id)
+                self.dirty.discard((server_id, user_id))
+                self.discard_activity(server_id, [user_id])
+                await self.bot.database.delete_user_xp(user_id, server_id)
+            if server_id in self.rewards:
+                self.queue_role_sync(server_id, user_id, urgent=True)
             await interaction.response.send_message(
                 f"“The statistics of {member.name} have been reset.",
                 ephemeral=True
@@ -228,13 +1640,262 @@ class XP(commands.Cog):
     @app_commands.checks.has_permissions(administrator=True)
     async def setlevelup(self, interaction: discord.Interaction, channel: discord.TextChannel = None):
         channel = channel or interaction.channel
-        server_id = str(interaction.guild_id)
+        server_id = interaction.guild_id
         
+        await self.set_setting(server_id, "level_up_channel", str(channel.id))
         self.level_up_channels[server_id] = channel.id
         await interaction.response.send_message(
             f"Salon de niveau configuré sur {channel.mention}",
             ephemeral=True
         )
 
+    @app_commands.command(name="xpcooldown", description="Shows or changes the minimum delay between two counted messages")
+    @app_commands.describe(seconds="New delay in seconds (0 counts every message), leave empty to only show the stats")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def xpcooldown(self, interaction: discord.Interaction, seconds: app_commands.Range[float, 0, 3600] = None):
+        server_id = interaction.guild_id
+        if seconds is not None:
+            await self.set_setting(server_id, "cooldown", str(seconds))
+            self.cooldowns[server_id] = seconds
+            self.update_cooldown_horizon()
+
+        gate = self.cooldown_gate
+        embed = discord.Embed(title="⏱️ XP cooldown", color=0xBEBEFE)
+        embed.add_field(name="Cooldown", value=f"{self.cooldowns.get(server_id, self.default_cooldown):g} s", inline=True)
+        embed.add_field(name="Dropped here", value=str(gate.dropped_by_guild[server_id]), inline=True)
+        embed.add_field(
+            name="All servers",
+            value=f"{gate.accepted} counted | {gate.dropped} dropped | {len(gate.last_counted)} tracked",
+            inline=False
+        )
+        embed.add_field(
+            name="Message queue",
+            value=f"{self.message_queue.qsize()}/{self.message_queue.maxsize} waiting | "
+                  f"{self.message_overflow[server_id]} dropped here when full",
+            inline=False
+        )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @app_commands.command(name="xpbackfill", description="Rebuilds message counts from the history of the text channels")
+    @app_commands.describe(restart="Discard an interrupted backfill and start over instead of resuming it")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def xpbackfill(self, interaction: discord.Interaction, restart: bool = False):
+        server_id = interaction.guild_id
+        if server_id in self.backfills:
+            stats = self.backfill_stats.get(server_id, Counter())
+            await interaction.response.send_message(
+                f"A backfill is already running: {stats['channels_done']}/{stats['channels']} channels, "
+                f"{stats['messages']} messages scanned.",
+                ephemeral=True
+            )
+            return
+
+        self.backfills[server_id] = asyncio.create_task(
+            self.run_backfill(interaction.guild, interaction.channel, restart)
+        )
+        await interaction.response.send_message(
+            "XP backfill started, the result will be posted in this channel. Run the command again to see the progress.",
+            ephemeral=True
+        )
+
+    @app_commands.command(name="setlevelreward", description="Sets or removes the role given when reaching a level")
+    @app_commands.describe(level="The level that grants the role", role="The role to give, leave empty to remove the reward")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def setlevelreward(
+        self,
+        interaction: discord.Interaction,
+        level: app_commands.Range[int, 1, MAX_LEVEL],
+        role: discord.Role = None,
+    ):
+        server_id = interaction.guild_id
+        if role is not None:
+            if role.is_default() or role.managed or role >= interaction.guild.me.top_role:
+                await interaction.response.send_message(
+                    f"I can't give {role.mention}: it must be a regular role below my highest role.",
+                    ephemeral=True
+                )
+                return
+            await self.bot.database.set_xp_reward(server_id, level, role.id)
+            self.rewards.setdefault(server_id, {})[level] = role.id
+        else:
+            await self.bot.database.delete_xp_reward(server_id, level)
+            self.rewards.get(server_id, {}).pop(level, None)
+            # Un rôle retiré du tableau n'est plus géré : les membres le gardent
+            if not self.rewards.get(server_id):
+                self.rewards.pop(server_id, None)
+
+        await interaction.response.defer(ephemeral=True)
+        queued = await self.resync_rewards(interaction.guild) if server_id in self.rewards else 0
+        await interaction.followup.send(
+            (f"Level {level} now gives {role.mention}." if role else f"Level {level} no longer gives a role.")
+            + f" {queued} members will be updated.",
+            ephemeral=True
+        )
+
+    @app_commands.command(name="levelrewards", description="Shows the level rewards and resynchronizes the members' roles")
+    @app_commands.describe(resync="Check every member's reward roles and fix the ones that differ")
+    @app_commands.checks.has_permissions(manage_roles=True)
+    async def levelrewards(self, interaction: discord.Interaction, resync: bool = False):
+        await interaction.response.defer(ephemeral=True)
+        server_id = interaction.guild_id
+        rewards = self.rewards.get(server_id, {})
+        embed = discord.Embed(title="🏅 Level rewards", color=0xBEBEFE)
+        embed.description = "\n".join(
+            f"Level {level}: <@&{role_id}>" for level, role_id in sorted(rewards.items())
+        ) or "No level rewards, use /setlevelreward to add one."
+        if resync and rewards:
+            queued = await self.resync_rewards(interaction.guild)
+            embed.set_footer(text=f"{queued} members queued for a role update")
+        else:
+            pending = sum(1 for key in self.role_sync_queue if key[0] == server_id)
+            embed.set_footer(text=f"{pending} members waiting for a role update")
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
+    @commands.command(name="xpexport", description="Exports the XP of a server as CSV or NDJSON.")
+    @commands.is_owner()
+    async def xpexport(self, context: commands.Context, fmt: str = "csv", server_id: int = None) -> None:
+        """
+        Exports the XP of a server as an attached file.
+
+        :param context: The context of the command.
+        :param fmt: `csv` or `ndjson`.
+        :param server_id: The server to export, the current one by default.
+        """
+        fmt = fmt.lower()
+        server_id = server_id or (context.guild.id if context.guild else None)
+        if fmt not in EXPORT_FORMATS or server_id is None:
+            embed = discord.Embed(
+                description="Usage: `xpexport [csv|ndjson] [server_id]` (the server is required in DMs).",
+                color=0xE02B2B
+            )
+            await context.send(embed=embed)
+            return
+
+        # Le fichier est assemblé en mémoire, sans passer par le disque
+        buffer = io.BytesIO()
+        async for line in self.export_xp(server_id, fmt):
+            buffer.write(line)
+        buffer.seek(0)
+        await context.send(file=discord.File(buffer, f"xp-{server_id}.{fmt}"))
+
+    @commands.command(name="xpimport", description="Merges an attached CSV or NDJSON XP export into a server.")
+    @commands.is_owner()
+    async def xpimport(self, context: commands.Context, server_id: int = None) -> None:
+        """
+        Merges an attached XP export into a server, each member keeping the highest count.
+
+        :param context: The context of the command.
+        :param server_id: The server to import into, the current one by default.
+        """
+        server_id = server_id or (context.guild.id if context.guild else None)
+        if not context.message.attachments or server_id is None:
+            embed = discord.Embed(
+                description="Attach a CSV or NDJSON export to `xpimport [server_id]` (the server is required in DMs).",
+                color=0xE02B2B
+            )
+            await context.send(embed=embed)
+            return
+
+        data = await context.message.attachments[0].read()
+        lines = io.TextIOWrapper(io.BytesIO(data), encoding="utf-8", errors="replace")
+        updated, errors, failure = await self.import_xp(server_id, lines)
+        description = f"{updated} members updated, {len(errors)} lines rejected."
+        if failure:
+            description += f"\nThe import stopped on a write error, the remaining lines were not applied: {failure}"
+        embed = discord.Embed(
+            description=description,
+            color=0xBEBEFE if not errors and not failure else 0xE02B2B
+        )
+        if errors:
+            embed.add_field(name="Rejected lines", value="\n".join(errors[:10])[:1024], inline=False)
+        await context.send(embed=embed)
+
+    @app_commands.command(name="xpprune", description="Configures the cleanup of departed members and the decay of inactive ones")
+    @app_commands.describe(
+        below="Remove members who left the server with fewer messages than this (0 disables)",
+        decay_days="Days without any message before a member's count starts to decay (0 disables)",
+        decay_percent="Share of their messages inactive members lose every day",
+        run_now="Run a pass right away and show what it reclaimed",
+    )
+    @app_commands.checks.has_permissions(administrator=True)
+    async def xpprune(
+        self,
+        interaction: discord.Interaction,
+        below: app_commands.Range[int, 0] = None,
+        decay_days: app_commands.Range[int, 0, ACTIVITY_DAYS_KEPT] = None,
+        decay_percent: app_commands.Range[float, 0, 100] = None,
+        run_now: bool = False,
+    ):
+        server_id = interaction.guild_id
+        config = self.prune_settings(server_id)
+        changes = {"below": below, "decay_days": decay_days, "decay_percent": decay_percent}
+        if any(value is not None for value in changes.values()):
+            config.update({key: value for key, value in changes.items() if value is not None})
+            if decay_days or decay_percent:
+                config.setdefault("since", time.time())
+            if config.get("below") or (config.get("decay_days") and config.get("decay_percent")):
+                await self.set_setting(server_id, "prune", json.dumps(config))
+            else:
+                await self.delete_setting(server_id, "prune")
+
+        await interaction.response.defer(ephemeral=True)
+        if run_now:
+            await self.prune_guild(server_id, force=True)
+
+        embed = discord.Embed(title="🧹 XP cleanup", color=0xBEBEFE)
+        embed.add_field(name="Departed members below", value=f"{config.get('below', 0)} messages", inline=True)
+        embed.add_field(
+            name="Decay",
+            value=f"{config.get('decay_percent', 0):g}% a day after {config.get('decay_days', 0)} inactive days",
+            inline=True
+        )
+        report = self.prune_reports.get(server_id)
+        if report:
+            embed.add_field(
+                name="Last pass",
+                value=f"{report['removed']} removed, {report['decayed']} decayed, "
+                      f"{report['memory'] / 1024:.1f} KiB of memory and {report['serialized'] / 1024:.1f} KiB of export reclaimed",
+                inline=False
+            )
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
+    @app_commands.command(name="setlevelcurve", description="Changes how many messages each level requires")
+    @app_commands.describe(
+        curve="The shape of the curve",
+        base="Messages for the first level (linear: for every level)",
+        factor="Growth factor between levels (exponential only)",
+        thresholds="Comma-separated total messages needed for level 2, 3, ... (custom only)",
+    )
+    @app_commands.choices(curve=[app_commands.Choice(name=name, value=name) for name in LevelCurve.CURVES])
+    @app_commands.checks.has_permissions(administrator=True)
+    async def setlevelcurve(
+        self,
+        interaction: discord.Interaction,
+        curve: app_commands.Choice[str],
+        base: app_commands.Range[int, 1] = 400,
+        factor: app_commands.Range[float, 1.0, MAX_CURVE_FACTOR] = 1.2,
+        thresholds: str = None,
+    ):
+        spec = {"curve": curve.value, "base": base}
+        if curve.value == "exponential":
+            spec["factor"] = factor
+        try:
+            if curve.value == "custom":
+                spec["thresholds"] = [int(value) for value in (thresholds or "").replace(" ", "").split(",") if value]
+            level_curve = LevelCurve(spec)
+        except ValueError as e:
+            await interaction.response.send_message(f"Invalid curve: {e}", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True)
+        count = await self.set_level_curve(interaction.guild_id, level_curve)
+        if interaction.guild_id in self.rewards:
+            await self.resync_rewards(interaction.guild)
+        preview = ", ".join(str(value) for value in level_curve.thresholds[1:6])
+        await interaction.followup.send(
+            f"Level curve set to **{curve.value}** ({count} members re-leveled). Messages needed for levels 2-6: {preview}",
+            ephemeral=True
+        )
+
 async def setup(bot):
     await bot.add_cog(XP(bot))
\ No newline at end of file
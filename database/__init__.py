@@ -6,6 +6,8 @@ Description:
 Version: 6.2.0
 """
 
+import time
+
 import aiosqlite
 
 
@@ -134,4 +136,576 @@ class DatabaseManager:
             result = await cursor.fetchone()
             return result[0] if result else 0
 
-    # Add methods for giveaways as needed
+    async def get_server_xp(self, server_id: int) -> list:
+        """
+        This function will get the XP entries of every user of a server.
+
+        :param server_id: The ID of the server.
+        :return: A list of (user_id, messages) rows.
+        """
+        rows = await self.connection.execute(
+            "SELECT user_id, xp FROM xp WHERE server_id=?",
+            (server_id,),
+        )
+        async with rows as cursor:
+            return await cursor.fetchall()
+
+    async def iter_server_xp(self, server_id: int):
+        """
+        This function will stream the XP entries of a server, best first, without loading them all in memory.
+
+        :param server_id: The ID of the server.
+        :return: An async iterator of (user_id, messages, level) rows.
+        """
+        async with self.connection.execute(
+            "SELECT user_id, xp, level FROM xp WHERE server_id=? ORDER BY xp DESC",
+            (server_id,),
+        ) as cursor:
+            async for row in cursor:
+                yield row
+
+    async def upsert_user_xp(self, entries: list) -> None:
+        """
+        This function will write a batch of XP entries in a single transaction.
+
+        :param entries: A list of (user_id, server_id, messages, level) rows.
+        """
+        if not entries:
+            return
+        try:
+            await self.connection.executemany(
+                "INSERT INTO xp(user_id, server_id, xp, level) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(user_id, server_id) DO UPDATE SET xp=excluded.xp, level=excluded.level",
+                entries,
+            )
+        except Exception:
+            # A partially written batch must not be committed along with the next write
+            await self.connection.rollback()
+            raise
+        await self.connection.commit()
+
+    async def delete_user_xp(self, user_id: int, server_id: int) -> None:
+        """
+        This function will remove the XP entry of a user on a server.
+
+        :param user_id: The ID of the user.
+        :param server_id: The ID of the server.
+        """
+        await self.connection.execute(
+            "DELETE FROM xp WHERE user_id=? AND server_id=?",
+            (
+                user_id,
+                server_id,
+            ),
+        )
+        await self.connection.execute(
+            "DELETE FROM xp_activity WHERE user_id=? AND server_id=?",
+            (
+                user_id,
+                server_id,
+            ),
+        )
+        await self.connection.execute(
+            "DELETE FROM xp_activity_hours WHERE user_id=? AND server_id=?",
+            (
+                user_id,
+                server_id,
+            ),
+        )
+        await self.connection.commit()
+
+    async def delete_users_xp(self, server_id: int, user_ids: list) -> None:
+        """
+        This function will remove the XP entries and the activity of several users of a server in a single transaction.
+
+        :param server_id: The ID of the server.
+        :param user_ids: The IDs of the users.
+        """
+        if not user_ids:
+            return
+        rows = [(user_id, server_id) for user_id in user_ids]
+        await self.connection.executemany(
+            "DELETE FROM xp WHERE user_id=? AND server_id=?", rows
+        )
+        await self.connection.executemany(
+            "DELETE FROM xp_activity WHERE user_id=? AND server_id=?", rows
+        )
+        await self.connection.executemany(
+            "DELETE FROM xp_activity_hours WHERE user_id=? AND server_id=?", rows
+        )
+        await self.connection.commit()
+
+    async def add_xp_activity(self, entries: list) -> None:
+        """
+        This function will add hourly message counts to the recent hours and to their days in a single transaction.
+
+        :param entries: A list of (server_id, user_id, hour, messages) rows, the hour being a UNIX timestamp divided by 3600.
+        """
+        if not entries:
+            return
+        await self.connection.executemany(
+            "INSERT INTO xp_activity_hours(server_id, user_id, hour, messages) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(server_id, hour, user_id) DO UPDATE SET messages=messages + excluded.messages",
+            entries,
+        )
+        await self.connection.executemany(
+            "INSERT INTO xp_activity(server_id, user_id, day, messages) VALUES (?, ?, ? / 24, ?) "
+            "ON CONFLICT(server_id, day, user_id) DO UPDATE SET messages=messages + excluded.messages",
+            entries,
+        )
+        await self.connection.commit()
+
+    async def get_server_xp_activity(self, server_id: int, since_day: int) -> list:
+        """
+        This function will get the daily message counts of a server since a given day.
+
+        :param server_id: The ID of the server.
+        :param since_day: The first day to return.
+        :return: A list of (user_id, day, messages) rows.
+        """
+        rows = await self.connection.execute(
+            "SELECT user_id, day, messages FROM xp_activity WHERE server_id=? AND day >= ?",
+            (
+                server_id,
+                since_day,
+            ),
+        )
+        async with rows as cursor:
+            return await cursor.fetchall()
+
+    async def get_server_xp_activity_hours(self, server_id: int, since_hour: int) -> list:
+        """
+        This function will get the hourly message counts of a server since a given hour.
+
+        :param server_id: The ID of the server.
+        :param since_hour: The first hour to return.
+        :return: A list of (user_id, hour, messages) rows.
+        """
+        rows = await self.connection.execute(
+            "SELECT user_id, hour, messages FROM xp_activity_hours WHERE server_id=? AND hour >= ?",
+            (
+                server_id,
+                since_hour,
+            ),
+        )
+        async with rows as cursor:
+            return await cursor.fetchall()
+
+    async def delete_xp_activity(self, before_day: int, before_hour: int) -> None:
+        """
+        This function will delete the daily message counts older than a given day and the hourly ones older than a given hour.
+
+        :param before_day: The first day to keep.
+        :param before_hour: The first hour to keep.
+        """
+        await self.connection.execute(
+            "DELETE FROM xp_activity WHERE day < ?",
+            (before_day,),
+        )
+        await self.connection.execute(
+            "DELETE FROM xp_activity_hours WHERE hour < ?",
+            (before_hour,),
+        )
+        await self.connection.commit()
+
+    async def relevel_xp(self, server_id: int, thresholds: list) -> None:
+        """
+        This function will recompute the stored level of every user of a server in a single statement.
+
+        :param server_id: The ID of the server.
+        :param thresholds: The cumulative message count needed for each level, starting with 0 for level 1.
+        """
+        await self.connection.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS xp_thresholds (messages INTEGER PRIMARY KEY)"
+        )
+        await self.connection.execute("DELETE FROM xp_thresholds")
+        await self.connection.executemany(
+            "INSERT INTO xp_thresholds(messages) VALUES (?)",
+            [(threshold,) for threshold in thresholds],
+        )
+        await self.connection.execute(
+            "UPDATE xp SET level = (SELECT COUNT(*) FROM xp_thresholds WHERE messages <= xp.xp) WHERE server_id=?",
+            (server_id,),
+        )
+        await self.connection.commit()
+
+    async def get_all_xp_settings(self) -> list:
+        """
+        This function will get the XP settings of every server.
+
+        :return: A list of (server_id, key, value) rows.
+        """
+        rows = await self.connection.execute(
+            "SELECT server_id, key, value FROM xp_settings"
+        )
+        async with rows as cursor:
+            return await cursor.fetchall()
+
+    async def set_xp_setting(self, server_id: int, key: str, value: str) -> None:
+        """
+        This function will create or replace an XP setting of a server.
+
+        :param server_id: The ID of the server.
+        :param key: The name of the setting.
+        :param value: The value of the setting, serialized as text.
+        """
+        await self.connection.execute(
+            "INSERT INTO xp_settings(server_id, key, value) VALUES (?, ?, ?) "
+            "ON CONFLICT(server_id, key) DO UPDATE SET value=excluded.value",
+            (
+                server_id,
+                key,
+                value,
+            ),
+        )
+        await self.connection.commit()
+
+    async def delete_xp_setting(self, server_id: int, key: str) -> None:
+        """
+        This function will remove an XP setting of a server.
+
+        :param server_id: The ID of the server.
+        :param key: The name of the setting.
+        """
+        await self.connection.execute(
+            "DELETE FROM xp_settings WHERE server_id=? AND key=?",
+            (
+                server_id,
+                key,
+            ),
+        )
+        await self.connection.commit()
+
+    async def get_all_xp_rewards(self) -> list:
+        """
+        This function will get the level rewards of every server.
+
+        :return: A list of (server_id, level, role_id) rows.
+        """
+        rows = await self.connection.execute(
+            "SELECT server_id, level, role_id FROM xp_rewards"
+        )
+        async with rows as cursor:
+            return await cursor.fetchall()
+
+    async def set_xp_reward(self, server_id: int, level: int, role_id: int) -> None:
+        """
+        This function will create or replace the role rewarded at a level of a server.
+
+        :param server_id: The ID of the server.
+        :param level: The level that grants the role.
+        :param role_id: The ID of the role.
+        """
+        await self.connection.execute(
+            "INSERT INTO xp_rewards(server_id, level, role_id) VALUES (?, ?, ?) "
+            "ON CONFLICT(server_id, level) DO UPDATE SET role_id=excluded.role_id",
+            (
+                server_id,
+                level,
+                role_id,
+            ),
+        )
+        await self.connection.commit()
+
+    async def delete_xp_reward(self, server_id: int, level: int) -> None:
+        """
+        This function will remove the role rewarded at a level of a server.
+
+        :param server_id: The ID of the server.
+        :param level: The level of the reward.
+        """
+        await self.connection.execute(
+            "DELETE FROM xp_rewards WHERE server_id=? AND level=?",
+            (
+                server_id,
+                level,
+            ),
+        )
+        await self.connection.commit()
+
+    async def get_xp_backfill_channels(self, server_id: int) -> dict:
+        """
+        This function will get the progress of an XP backfill for every channel of a server.
+
+        :param server_id: The ID of the server.
+        :return: A dict of channel_id -> (last_message_id, done).
+        """
+        rows = await self.connection.execute(
+            "SELECT channel_id, last_message_id, done FROM xp_backfill_channels WHERE server_id=?",
+            (server_id,),
+        )
+        async with rows as cursor:
+            return {
+                channel_id: (last_message_id, bool(done))
+                for channel_id, last_message_id, done in await cursor.fetchall()
+            }
+
+    async def save_xp_backfill_checkpoint(
+        self, server_id: int, channel_id: int, last_message_id: int, done: bool, counts: list
+    ) -> None:
+        """
+        This function will save the progress of a channel and the messages counted since the last checkpoint, atomically.
+
+        :param server_id: The ID of the server.
+        :param channel_id: The ID of the channel.
+        :param last_message_id: The ID of the last message that has been counted.
+        :param done: Whether the whole channel has been scanned.
+        :param counts: A list of (user_id, messages) counted since the previous checkpoint.
+        """
+        await self.connection.executemany(
+            "INSERT INTO xp_backfill_counts(server_id, user_id, messages) VALUES (?, ?, ?) "
+            "ON CONFLICT(server_id, user_id) DO UPDATE SET messages=messages + excluded.messages",
+            [(server_id, user_id, messages) for user_id, messages in counts],
+        )
+        await self.connection.execute(
+            "INSERT INTO xp_backfill_channels(server_id, channel_id, last_message_id, done) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(server_id, channel_id) DO UPDATE SET last_message_id=excluded.last_message_id, done=excluded.done",
+            (
+                server_id,
+                channel_id,
+                last_message_id,
+                int(done),
+            ),
+        )
+        await self.connection.commit()
+
+    async def save_xp_backfill_baseline(self, server_id: int, counts: list) -> None:
+        """
+        This function will save the live message counts of a server at the start of its XP backfill.
+
+        :param server_id: The ID of the server.
+        :param counts: A list of (user_id, messages) rows.
+        """
+        await self.connection.executemany(
+            "INSERT OR REPLACE INTO xp_backfill_baseline(server_id, user_id, messages) VALUES (?, ?, ?)",
+            [(server_id, user_id, messages) for user_id, messages in counts],
+        )
+        await self.connection.commit()
+
+    async def get_xp_backfill_counts(self, server_id: int) -> list:
+        """
+        This function will get the message counts gathered by the XP backfill of a server.
+
+        :param server_id: The ID of the server.
+        :return: A list of (user_id, messages, live messages when the backfill started) rows.
+        """
+        rows = await self.connection.execute(
+            "SELECT c.user_id, c.messages, COALESCE(b.messages, 0) FROM xp_backfill_counts c "
+            "LEFT JOIN xp_backfill_baseline b ON b.server_id=c.server_id AND b.user_id=c.user_id "
+            "WHERE c.server_id=?",
+            (server_id,),
+        )
+        async with rows as cursor:
+            return await cursor.fetchall()
+
+    async def clear_xp_backfill(self, server_id: int) -> None:
+        """
+        This function will remove every trace of the XP backfill of a server.
+
+        :param server_id: The ID of the server.
+        """
+        await self.connection.execute(
+            "DELETE FROM xp_backfill_channels WHERE server_id=?", (server_id,)
+        )
+        await self.connection.execute(
+            "DELETE FROM xp_backfill_counts WHERE server_id=?", (server_id,)
+        )
+        await self.connection.execute(
+            "DELETE FROM xp_backfill_baseline WHERE server_id=?", (server_id,)
+        )
+        await self.connection.commit()
+
+    async def add_giveaway(
+        self,
+        message_id: int,
+        channel_id: int,
+        server_id: int,
+        prize: str,
+        winners: int,
+        end_time: float,
+        entry_mode: str = "button",
+    ) -> None:
+        """
+        This function will add a running giveaway.
+
+        :param message_id: The ID of the giveaway message.
+        :param channel_id: The ID of the channel of the giveaway.
+        :param server_id: The ID of the server of the giveaway.
+        :param prize: The prize to win.
+        :param winners: The number of winners.
+        :param end_time: The timestamp at which the giveaway ends.
+        :param entry_mode: `button` if entries are recorded in giveaway_entries, `reaction` if they are read from the message.
+        """
+        await self.connection.execute(
+            "INSERT OR REPLACE INTO giveaways(message_id, channel_id, server_id, prize, winners, end_time, entry_mode) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                message_id,
+                channel_id,
+                server_id,
+                prize,
+                winners,
+                end_time,
+                entry_mode,
+            ),
+        )
+        await self.connection.commit()
+
+    async def get_giveaway(self, message_id: int) -> tuple:
+        """
+        This function will get a running giveaway from its message.
+
+        :param message_id: The ID of the giveaway message.
+        :return: A (message_id, channel_id, server_id, prize, winners, end_time, entry_mode) row, or None.
+        """
+        rows = await self.connection.execute(
+            "SELECT message_id, channel_id, server_id, prize, winners, end_time, entry_mode FROM giveaways WHERE message_id=?",
+            (message_id,),
+        )
+        async with rows as cursor:
+            return await cursor.fetchone()
+
+    async def get_giveaways_ending_before(self, end_time: float) -> list:
+        """
+        This function will get the running giveaways that end before a given time, soonest first.
+
+        :param end_time: The timestamp up to which giveaways are returned.
+        :return: A list of (message_id, end_time) rows.
+        """
+        rows = await self.connection.execute(
+            "SELECT message_id, end_time FROM giveaways WHERE end_time<=? ORDER BY end_time",
+            (end_time,),
+        )
+        async with rows as cursor:
+            return await cursor.fetchall()
+
+    async def take_giveaways(self, message_ids: list) -> list:
+        """
+        This function will move several running giveaways to the ended ones in a single transaction and return them.
+
+        :param message_ids: The IDs of the giveaway messages.
+        :return: A list of the (message_id, channel_id, server_id, prize, winners, end_time, entry_mode) rows that were removed.
+        """
+        giveaways = []
+        for message_id in message_ids:
+            async with self.connection.execute(
+                "SELECT message_id, channel_id, server_id, prize, winners, end_time, entry_mode FROM giveaways WHERE message_id=?",
+                (message_id,),
+            ) as cursor:
+                row = await cursor.fetchone()
+            if row:
+                giveaways.append(row)
+        ended_at = time.time()
+        await self.connection.executemany(
+            "INSERT OR REPLACE INTO ended_giveaways(message_id, channel_id, server_id, prize, winners, ended_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(*row[:5], ended_at) for row in giveaways],
+        )
+        await self.connection.executemany(
+            "DELETE FROM giveaways WHERE message_id=?",
+            [(row[0],) for row in giveaways],
+        )
+        await self.connection.commit()
+        return giveaways
+
+    async def delete_giveaway(self, message_id: int) -> None:
+        """
+        This function will delete a running giveaway and its entries without drawing it.
+
+        :param message_id: The ID of the giveaway message.
+        """
+        await self.connection.execute(
+            "DELETE FROM giveaways WHERE message_id=?", (message_id,)
+        )
+        await self.connection.execute(
+            "DELETE FROM giveaway_entries WHERE message_id=?", (message_id,)
+        )
+        await self.connection.commit()
+
+    async def get_ended_giveaway(self, message_id: int) -> tuple:
+        """
+        This function will get an ended giveaway from its message.
+
+        :param message_id: The ID of the giveaway message.
+        :return: A (message_id, channel_id, server_id, prize, winners, ended_at) row, or None.
+        """
+        rows = await self.connection.execute(
+            "SELECT message_id, channel_id, server_id, prize, winners, ended_at FROM ended_giveaways WHERE message_id=?",
+            (message_id,),
+        )
+        async with rows as cursor:
+            return await cursor.fetchone()
+
+    async def add_giveaway_entry(self, message_id: int, user_id: int) -> bool:
+        """
+        This function will record that a user entered a giveaway, once.
+
+        :param message_id: The ID of the giveaway message.
+        :param user_id: The ID of the user.
+        :return: True if the user just entered, False if they had already entered.
+        """
+        cursor = await self.connection.execute(
+            "INSERT OR IGNORE INTO giveaway_entries(message_id, user_id) VALUES (?, ?)",
+            (
+                message_id,
+                user_id,
+            ),
+        )
+        await self.connection.commit()
+        return cursor.rowcount == 1
+
+    async def add_giveaway_entries(self, message_id: int, user_ids: list) -> None:
+        """
+        This function will record a batch of giveaway entrants in a single transaction, ignoring duplicates.
+
+        :param message_id: The ID of the giveaway message.
+        :param user_ids: The IDs of the users.
+        """
+        await self.connection.executemany(
+            "INSERT OR IGNORE INTO giveaway_entries(message_id, user_id) VALUES (?, ?)",
+            [(message_id, user_id) for user_id in user_ids],
+        )
+        await self.connection.commit()
+
+    async def iter_giveaway_entries(self, message_id: int):
+        """
+        This function will stream the users who entered a giveaway, by increasing ID, without loading them all in memory.
+
+        :param message_id: The ID of the giveaway message.
+        :return: An async iterator of user IDs.
+        """
+        async with self.connection.execute(
+            "SELECT user_id FROM giveaway_entries WHERE message_id=? ORDER BY user_id",
+            (message_id,),
+        ) as cursor:
+            async for user_id, in cursor:
+                yield user_id
+
+    async def add_giveaway_winners(self, message_id: int, user_ids: list, seed: str) -> None:
+        """
+        This function will add users to the winners of a giveaway.
+
+        :param message_id: The ID of the giveaway message.
+        :param user_ids: The IDs of the users who have been drawn.
+        :param seed: The seed of the draw, to audit it.
+        """
+        drawn_at = time.time()
+        await self.connection.executemany(
+            "INSERT OR IGNORE INTO giveaway_winners(message_id, user_id, drawn_at, seed) VALUES (?, ?, ?, ?)",
+            [(message_id, user_id, drawn_at, seed) for user_id in user_ids],
+        )
+        await self.connection.commit()
+
+    async def get_giveaway_winners(self, message_id: int) -> list:
+        """
+        This function will get every user who has won a giveaway, rerolls included.
+
+        :param message_id: The ID of the giveaway message.
+        :return: A list of user IDs.
+        """
+        rows = await self.connection.execute(
+            "SELECT user_id FROM giveaway_winners WHERE message_id=? ORDER BY drawn_at",
+            (message_id,),
+        )
+        async with rows as cursor:
+            return [user_id for user_id, in await cursor.fetchall()]
@@ -1,3 +1,7 @@
+-- Write-ahead log: each commit is appended to database.db-wal instead of rewriting pages in place,
+-- SQLite checkpoints it back into the database every 1000 pages by default, which bounds the replay on startup
+PRAGMA journal_mode=WAL;
+
 CREATE TABLE IF NOT EXISTS `warns` (
   `id` int(11) NOT NULL,
   `user_id` varchar(20) NOT NULL,
@@ -13,4 +17,104 @@ CREATE TABLE IF NOT EXISTS xp (
     xp INTEGER DEFAULT 0,
     level INTEGER DEFAULT 0,
     PRIMARY KEY (user_id, server_id)
-);
\ No newline at end of file
+);
+
+CREATE INDEX IF NOT EXISTS idx_xp_server_xp ON xp (server_id, xp);
+
+CREATE TABLE IF NOT EXISTS xp_activity (
+    server_id BIGINT,
+    user_id BIGINT,
+    day INTEGER,
+    messages INTEGER DEFAULT 0,
+    PRIMARY KEY (server_id, day, user_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_xp_activity_day ON xp_activity (day);
+
+-- Recent hours, also counted in their day in xp_activity, so that daily windows survive a reload
+CREATE TABLE IF NOT EXISTS xp_activity_hours (
+    server_id BIGINT,
+    user_id BIGINT,
+    hour INTEGER,
+    messages INTEGER DEFAULT 0,
+    PRIMARY KEY (server_id, hour, user_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_xp_activity_hours_hour ON xp_activity_hours (hour);
+
+CREATE TABLE IF NOT EXISTS xp_backfill_channels (
+    server_id BIGINT,
+    channel_id BIGINT,
+    last_message_id BIGINT,
+    done INTEGER DEFAULT 0,
+    PRIMARY KEY (server_id, channel_id)
+);
+
+CREATE TABLE IF NOT EXISTS xp_backfill_counts (
+    server_id BIGINT,
+    user_id BIGINT,
+    messages INTEGER DEFAULT 0,
+    PRIMARY KEY (server_id, user_id)
+);
+
+-- Live message counts when the backfill started, to keep the messages counted while it runs
+CREATE TABLE IF NOT EXISTS xp_backfill_baseline (
+    server_id BIGINT,
+    user_id BIGINT,
+    messages INTEGER DEFAULT 0,
+    PRIMARY KEY (server_id, user_id)
+);
+
+CREATE TABLE IF NOT EXISTS xp_rewards (
+    server_id BIGINT,
+    level INTEGER,
+    role_id BIGINT,
+    PRIMARY KEY (server_id, level)
+);
+
+CREATE TABLE IF NOT EXISTS xp_settings (
+    server_id BIGINT,
+    key TEXT,
+    value TEXT,
+    PRIMARY KEY (server_id, key)
+);
+
+CREATE TABLE IF NOT EXISTS giveaways (
+    message_id BIGINT PRIMARY KEY,
+    channel_id BIGINT NOT NULL,
+    server_id BIGINT,
+    prize TEXT NOT NULL,
+    winners INTEGER NOT NULL,
+    end_time REAL NOT NULL,
+    entry_mode TEXT NOT NULL DEFAULT 'button'
+);
+
+CREATE INDEX IF NOT EXISTS idx_giveaways_end_time ON giveaways (end_time);
+
+CREATE TABLE IF NOT EXISTS giveaway_entries (
+    message_id BIGINT,
+    user_id BIGINT,
+    PRIMARY KEY (message_id, user_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS ended_giveaways (
+    message_id BIGINT PRIMARY KEY,
+    channel_id BIGINT NOT NULL,
+    server_id BIGINT,
+    prize TEXT NOT NULL,
+    winners INTEGER NOT NULL,
+    ended_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS giveaway_winners (
+    message_id BIGINT,
+    user_id BIGINT,
+    drawn_at REAL NOT NULL,
+    seed TEXT NOT NULL,
+    PRIMARY KEY (message_id, user_id)
+);
+
+-- Level up channels that were previously hard-coded in the XP cog, kept unless changed with /setlevelup
+INSERT OR IGNORE INTO xp_settings (server_id, key, value) VALUES
+    (797781758841847808, 'level_up_channel', '1104041737850196019'),
+    (1289627804211609640, 'level_up_channel', '1336777782952198274');